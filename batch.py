@@ -0,0 +1,118 @@
+"""
+Processes several data subfolders at once. The mapping is loaded once and shared by the
+worker processes, files common to more subfolders are parsed only once (by the on-disk
+cache). Each subfolder gets its own details and summary files, named by the path of the
+subfolder with the separators replaced by "_" (e.g. "summary 2024_01.json" for 2024/01).
+
+Usage: python batch.py [--workers N] [--days D] [--combine] <data_subfolder|glob> ...
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from categories import export_mapping, install_mapping
+from read import DATA_PARENT
+from write import summary_dict
+from comb import combine
+import run
+
+
+def output_name(subfolder: str) -> str:
+    """Returns the name of the output files of the subfolder."""
+    return os.path.normpath(subfolder).replace(os.sep, "_")
+
+
+def resolve_subfolders(patterns: list[str]) -> list[str]:
+    """
+    Returns the data subfolders matching the patterns, relative to the data folder.
+    Raises ValueError if the outputs of two subfolders would have the same name.
+    """
+    subfolders: list[str] = []
+    names: dict[str, str] = {}
+    for pattern in patterns:
+        matches = sorted(glob.glob(os.path.join(DATA_PARENT, pattern)))
+        if not matches:
+            raise ValueError(f"Žádná složka dat neodpovídá: {pattern}")
+        for path in matches:
+            subfolder = os.path.relpath(path, DATA_PARENT)
+            if os.path.isdir(path) and subfolder not in subfolders:
+                name = output_name(subfolder)
+                if name in names:
+                    raise ValueError(
+                        f"Složky dat {names[name]} a {subfolder} mají stejný název "
+                        f"výstupů: {name}"
+                    )
+                names[name] = subfolder
+                subfolders.append(subfolder)
+    return subfolders
+
+
+def _process(subfolder: str, days: int) -> tuple[dict, float]:
+    start = time.perf_counter()
+    name = output_name(subfolder)
+    result = run.run(
+        subfolder, name, days=days, verbose=False, matching_path=f"transaction_matching {name}.json"
+    )
+    return summary_dict(result), time.perf_counter() - start
+
+
+def run_batch(subfolders: list[str], workers: int = 1, days: int = 30) -> dict[str, dict]:
+    """
+    Processes the subfolders in a pool of `workers` processes and returns their summaries
+    (as `write.summary_dict`) in the order of `subfolders`.
+    """
+    summaries: dict[str, dict] = {}
+    if workers > 1 and len(subfolders) > 1:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(subfolders)),
+            initializer=install_mapping,
+            initargs=(export_mapping(),),
+        ) as executor:
+            futures = {executor.submit(_process, s, days): s for s in subfolders}
+            for future in as_completed(futures):
+                summaries[futures[future]], seconds = future.result()
+                print(f"{futures[future]:<30} {seconds:>8.2f} s")
+    else:
+        for subfolder in subfolders:
+            summaries[subfolder], seconds = _process(subfolder, days)
+            print(f"{subfolder:<30} {seconds:>8.2f} s")
+    return {subfolder: summaries[subfolder] for subfolder in subfolders}
+
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    workers = os.cpu_count() or 1
+    days = 30
+    combined = "--combine" in args
+    if combined:
+        args.remove("--combine")
+    for option in ("--workers", "--days"):
+        if option in args:
+            i = args.index(option)
+            value = int(args[i + 1])
+            del args[i : i + 2]
+            if option == "--workers":
+                workers = value
+            else:
+                days = value
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    summaries = run_batch(resolve_subfolders(args), workers=workers, days=days)
+    print(f"{'Celkem':<30} {time.perf_counter() - start:>8.2f} s")
+
+    if combined:
+        with open("combined_summary.json", "w", encoding="utf-8") as json_file:
+            json.dump(
+                combine(summaries.values()),
+                json_file,
+                ensure_ascii=False,
+                indent=4,
+            )
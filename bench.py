@@ -0,0 +1,349 @@
+"""
+Benchmarks of the hot spots of the pipeline.
+
+Usage: python bench.py <benchmark> [...]
+"""
+
+import os
+import sys
+import json
+import random
+import platform
+import shutil
+import string
+import subprocess
+import tempfile
+import time
+from typing import Callable
+
+from constants import MAPPING_DIR, CACHE_DIR
+from matcher import PatternMatcher
+from synth import ExportGenerator
+
+
+def _timed(func: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def _enter_workdir(generator: ExportGenerator, partial_rules: int = 1000) -> str:
+    """
+    Creates a temporary working directory with a synthetic mapping and makes it the current one.
+    Has to be called before the mapping is used for the first time.
+    """
+    workdir = tempfile.mkdtemp(prefix="finance-bench-")
+    os.chdir(workdir)
+    generator.write_mapping(MAPPING_DIR, partial_rules=partial_rules)
+    return workdir
+
+
+def _random_word(rng: random.Random, min_len: int = 3, max_len: int = 10) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(min_len, max_len)))
+
+
+def bench_partial(sizes: tuple[int, ...] = (10, 100, 1000, 10000), rows: int = 20000) -> None:
+    """Compares per-row cost of partial-rule matching by a linear scan and by the automaton."""
+    rng = random.Random(0)
+    keys = [
+        " ".join(_random_word(rng) for _ in range(rng.randint(2, 6))).upper() for _ in range(rows)
+    ]
+    print(f"{'rules':>8} {'scan [µs/row]':>15} {'automaton [µs/row]':>20}")
+    for size in sizes:
+        patterns = list(dict.fromkeys(_random_word(rng, 4, 8) for _ in range(size)))
+        matcher = PatternMatcher(patterns)
+
+        start = time.perf_counter()
+        for key in keys:
+            for pattern in patterns:
+                if pattern in key.lower():
+                    break
+        scan = (time.perf_counter() - start) / rows * 1e6
+
+        start = time.perf_counter()
+        for key in keys:
+            matcher.first_match(key.lower())
+        automaton = (time.perf_counter() - start) / rows * 1e6
+
+        print(f"{size:>8} {scan:>15.2f} {automaton:>20.2f}")
+
+
+def bench_parallel(file_counts: tuple[int, ...] = (1, 2, 4, 8, 16), rows: int = 5000) -> None:
+    """Compares sequential and parallel loading of an increasing number of files."""
+    workers = os.cpu_count() or 1
+    generator = ExportGenerator()
+    workdir = _enter_workdir(generator)
+    from read import load_data
+    from categories import clear_cache
+
+    paths: list[str] = []
+    print(f"{workers} workers")
+    print(f"{'files':>8} {'sequential [s]':>16} {'parallel [s]':>14} {'speedup':>9}")
+    for count in file_counts:
+        while len(paths) < count:
+            paths.append(os.path.join(workdir, f"csob_{len(paths)}.csv"))
+            generator.write_csob(paths[-1], rows)
+        clear_cache()
+        sequential = _timed(lambda: load_data(*paths[:count]))
+        clear_cache()
+        parallel = _timed(lambda: load_data(*paths[:count], workers=workers))
+        print(f"{count:>8} {sequential:>16.3f} {parallel:>14.3f} {sequential / parallel:>9.2f}")
+    shutil.rmtree(workdir)
+
+
+def bench_cold_start(partial_rules: int = 5000, repeats: int = 5) -> None:
+    """Measures the start of a process importing the categories, with and without the snapshot."""
+    generator = ExportGenerator()
+    workdir = _enter_workdir(generator, partial_rules=partial_rules)
+    env = {**os.environ, "PYTHONPATH": os.path.dirname(os.path.abspath(__file__))}
+
+    def start(code: str, remove_snapshot: bool = False) -> float:
+        times = []
+        for _ in range(repeats):
+            if remove_snapshot:
+                shutil.rmtree(CACHE_DIR, ignore_errors=True)
+            command = [sys.executable, "-c", code]
+            times.append(_timed(lambda: subprocess.run(command, env=env, check=True)))
+        return min(times)
+
+    categorize = "import categories; categories.get_category('x')"
+    baseline = start("pass")
+    print(f"{partial_rules} partial rules, process start without imports: {baseline:.3f} s")
+    import_only = start("import categories") - baseline
+    no_snapshot = start(categorize, remove_snapshot=True) - baseline
+    with_snapshot = start(categorize) - baseline
+    print(f"import only (lazy mapping):  {import_only:>8.3f} s")
+    print(f"categorize, no snapshot:     {no_snapshot:>8.3f} s")
+    print(f"categorize, with snapshot:   {with_snapshot:>8.3f} s")
+    shutil.rmtree(workdir)
+
+
+def bench_stages(
+    rows: int = 20000,
+    partial_rules: int = 1000,
+    output: str = "bench_results.json",
+    seed: int = 0,
+) -> None:
+    """
+    Times the stages of the pipeline on synthetic exports of all the banks, `rows` rows each,
+    and saves the results to the JSON file.
+    """
+    output = os.path.abspath(output)
+    generator = ExportGenerator(seed=seed)
+    workdir = _enter_workdir(generator, partial_rules=partial_rules)
+    paths = generator.write_exports(os.path.join("data", "bench"), rows)
+
+    from utils import iter_lines
+    from categories import get_category, clear_cache, load_mapping
+    from read import load_data
+    from process import process_transactions
+    from matching import match_transfers
+    from write import write_details, write_summary
+
+    load_mapping()
+    stages: dict[str, float] = {}
+    per_bank: dict[str, float] = {}
+
+    def parse() -> None:
+        for path in paths:
+            with open(path, "r", newline="", encoding="utf-8-sig") as file:
+                for _ in iter_lines(file):
+                    pass
+
+    stages["parse"] = _timed(parse)
+    for path in paths:
+        clear_cache()
+        per_bank[os.path.basename(path).split("_")[0]] = rows / _timed(lambda: load_data(path))
+    clear_cache()
+    data: list = []
+    stages["load"] = _timed(lambda: data.extend(load_data(*paths)))
+
+    def categorize() -> None:
+        for transaction in data:
+            get_category(*transaction.keys)
+
+    clear_cache()
+    stages["categorize"] = _timed(categorize)
+    stages["categorize_cached"] = _timed(categorize)
+    stages["aggregate"] = _timed(lambda: process_transactions(data, days=30))
+    transfers = [t for t in data if t.category == "Převod"]
+    stages["match"] = _timed(lambda: match_transfers(transfers))
+    result = process_transactions(data, days=30)
+    stages["write"] = _timed(lambda: (write_details(data, "bench"), write_summary(result, "bench")))
+
+    report = {
+        "config": {
+            "rows_per_file": rows,
+            "files": len(paths),
+            "partial_rules": partial_rules,
+            "seed": seed,
+            "python": platform.python_version(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "stages": stages,
+        "rows_per_second": per_bank,
+        "transfers": len(transfers),
+    }
+    for stage, seconds in stages.items():
+        print(f"{stage:<20} {seconds:>8.3f} s")
+    for bank, speed in per_bank.items():
+        print(f"{bank:<20} {speed:>8.0f} rows/s")
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=4)
+    print(f"Saved to {output}")
+    shutil.rmtree(workdir)
+
+
+def bench_compare(baseline: str, current: str) -> None:
+    """Compares the stage times of two results saved by `bench_stages`."""
+    with open(baseline, "r", encoding="utf-8") as file:
+        old = json.load(file)
+    with open(current, "r", encoding="utf-8") as file:
+        new = json.load(file)
+    print(f"{'stage':<20} {'baseline [s]':>13} {'current [s]':>12} {'ratio':>7}")
+    for stage, seconds in new["stages"].items():
+        if stage in old["stages"]:
+            ratio = seconds / old["stages"][stage] if old["stages"][stage] else float("nan")
+            print(f"{stage:<20} {old['stages'][stage]:>13.3f} {seconds:>12.3f} {ratio:>7.2f}")
+
+
+def bench_exact(rows: int = 20000, summaries: int = 1000, repeats: int = 5) -> None:
+    """
+    Compares the float amounts with the integer haléře: loading, aggregation and combining
+    of many summaries, including the error of the combined totals.
+    """
+    generator = ExportGenerator()
+    workdir = _enter_workdir(generator)
+    paths = generator.write_exports(os.path.join("data", "bench"), rows)
+
+    from categories import load_mapping
+    from read import load_data
+    from process import process_transactions
+    from write import summary_dict
+    from comb import combine
+
+    load_mapping()
+    print(f"{'':<12} {'float [s]':>10} {'exact [s]':>10}")
+    data = {}
+    for exact in (False, True):
+        data[exact] = load_data(*paths, exact=exact)
+    for stage, run in (
+        ("load", lambda exact: load_data(*paths, exact=exact)),
+        ("aggregate", lambda exact: process_transactions(data[exact], days=31)),
+    ):
+        times = [min(_timed(lambda: run(exact)) for _ in range(repeats)) for exact in (False, True)]
+        print(f"{stage:<12} {times[0]:>10.3f} {times[1]:>10.3f}")
+
+    # Summaries of random subsets of the transactions, combined by both representations
+    rng = random.Random(0)
+    parts = [
+        summary_dict(process_transactions(rng.sample(data[True], 100), days=30))
+        for _ in range(summaries)
+    ]
+
+    def float_combine() -> dict[str, float]:
+        # Summing the rounded amounts, as the summaries were combined before
+        totals: dict[str, float] = {}
+        for part in parts:
+            for category, amount in part["příjmy"].items():
+                totals[category] = round(totals.get(category, 0.0) + amount, 2)
+        return totals
+
+    totals = [float_combine(), combine(parts)["příjmy"]]
+    times = [_timed(float_combine), _timed(lambda: combine(parts))]
+    print(f"{'combine':<12} {times[0]:>10.3f} {times[1]:>10.3f}")
+    expected: dict[str, int] = {}
+    for part in parts:
+        for category, amount in part["příjmy"].items():
+            expected[category] = expected.get(category, 0) + round(amount * 100)
+    for name, combined in zip(("float", "exact"), totals):
+        wrong = sum(round(combined[c] * 100) != amount for c, amount in expected.items())
+        print(f"{name} combine of {summaries} summaries: {wrong} wrong category totals")
+    shutil.rmtree(workdir)
+
+
+def bench_pipeline(files: int = 8, rows: int = 20000) -> None:
+    """
+    Compares the loading of the files one after another, in parallel processes and by the
+    pipeline, and prints the depths and waits of the pipeline queues.
+    """
+    workers = os.cpu_count() or 1
+    generator = ExportGenerator()
+    workdir = _enter_workdir(generator)
+    paths: list[str] = []
+    for i in range(files):
+        paths.append(os.path.join(workdir, f"csob_{i}.csv"))
+        generator.write_csob(paths[-1], rows)
+
+    from read import load_data
+    from categories import clear_cache
+    from pipeline import load_pipelined
+
+    expected = load_data(*paths)
+    print(f"{workers} workers, {files} files of {rows} rows")
+    for name, run in (
+        ("sequential", lambda: load_data(*paths)),
+        ("parallel", lambda: load_data(*paths, workers=workers)),
+        ("pipelined", lambda: load_data(*paths, pipelined=True)),
+        ("pipelined+", lambda: load_data(*paths, workers=workers, pipelined=True)),
+    ):
+        clear_cache()
+        print(f"{name:<12} {_timed(run):>8.3f} s")
+    clear_cache()
+    per_file, stats = load_pipelined(*paths, workers=workers)
+    assert [t for transactions in per_file for t in transactions] == expected
+    for stage in ("blocks", "batches", "categorize"):
+        print(f"{stage:<12}", ", ".join(f"{k} {v:.3g}" for k, v in stats[stage].items()))
+    shutil.rmtree(workdir)
+
+
+def bench_memory(rows: int = 1000000) -> None:
+    """
+    Measures the peak RSS of loading `rows` rows (split among the banks) as the list of
+    transactions and as the columnar store, each in a fresh process.
+    """
+    generator = ExportGenerator()
+    workdir = _enter_workdir(generator)
+    paths = generator.write_exports(os.path.join("data", "bench"), rows // 4)
+    env = {**os.environ, "PYTHONPATH": os.path.dirname(os.path.abspath(__file__))}
+    prelude = (
+        "import sys, json, resource\n"
+        "from read import load_data, iter_data\n"
+        "from columnar import TransactionStore\n"
+        f"paths = {paths!r}\n"
+    )
+    loads = {
+        "imports only": "data = []",
+        "list": "data = load_data(*paths)",
+        "store": "data = TransactionStore.from_transactions(iter_data(*paths))",
+    }
+    print(f"{rows} rows")
+    for name, load in loads.items():
+        code = prelude + load + "\nprint(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+        output = subprocess.run(
+            [sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True
+        ).stdout
+        # Kilobytes on Linux
+        print(f"{name:<14} {int(output.split()[-1]) / 1024:>8.0f} MB")
+    shutil.rmtree(workdir)
+
+
+BENCHMARKS = {
+    "partial": bench_partial,
+    "parallel": bench_parallel,
+    "cold_start": bench_cold_start,
+    "stages": bench_stages,
+    "compare": bench_compare,
+    "exact": bench_exact,
+    "pipeline": bench_pipeline,
+    "memory": bench_memory,
+}
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"Usage: python bench.py <{'|'.join(BENCHMARKS)}>")
+        sys.exit(1)
+
+    BENCHMARKS[sys.argv[1]](*[int(arg) if arg.isdigit() else arg for arg in sys.argv[2:]])
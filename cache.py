@@ -0,0 +1,121 @@
+"""
+On-disk cache of parsed source files.
+
+Usage: python cache.py <info|clear>
+"""
+
+import os
+import sys
+import pickle
+import hashlib
+import tempfile
+from typing import Any
+
+from constants import CACHE_DIR, CACHE_MAX_BYTES
+
+
+# Change whenever the cached content changes for the same input file and mapping
+CACHE_FORMAT = 2
+_SUFFIX = ".pickle"
+
+
+def entry_key(file_path: str, mapping_fingerprint: str, variant: str = "") -> str:
+    """
+    Returns the cache key of the file based on its content, the mapping used to read it and
+    the variant of reading (such as the representation of the amounts).
+    """
+    digest = hashlib.sha1(f"{CACHE_FORMAT}:{mapping_fingerprint}:{variant}:".encode("utf-8"))
+    with open(file_path, "rb") as file:
+        while chunk := file.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load(key: str) -> Any:
+    """Returns the cached object or None, if there is no entry for the key."""
+    path = _entry_path(key)
+    try:
+        with open(path, "rb") as file:
+            obj = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    # Mark the entry as recently used, unless another process has just evicted it
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return obj
+
+
+def store(key: str, obj: Any) -> None:
+    """Stores the object and evicts the least recently used entries exceeding the cache size."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # A temporary file of its own, other processes may be storing the same entry
+    fd, tmp_path = tempfile.mkstemp(prefix=key, suffix=".tmp", dir=CACHE_DIR)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            pickle.dump(obj, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, _entry_path(key))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    evict(CACHE_MAX_BYTES)
+
+
+def evict(max_bytes: int) -> int:
+    """Removes the least recently used entries until the cache fits the size. Returns their count."""
+    entries = sorted(_entries(), key=lambda entry: entry[1].st_mtime)
+    total = sum(stat.st_size for _, stat in entries)
+    removed = 0
+    for path, stat in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            # Evicted by another process
+            pass
+        total -= stat.st_size
+    return removed
+
+
+def info() -> dict[str, int]:
+    entries = _entries()
+    return {"entries": len(entries), "bytes": sum(stat.st_size for _, stat in entries)}
+
+
+def clear() -> int:
+    return evict(0)
+
+
+def _entry_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, key + _SUFFIX)
+
+
+def _entries() -> list[tuple[str, os.stat_result]]:
+    if not os.path.isdir(CACHE_DIR):
+        return []
+    paths = [
+        os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR) if name.endswith(_SUFFIX)
+    ]
+    entries = []
+    for path in paths:
+        try:
+            entries.append((path, os.stat(path)))
+        except FileNotFoundError:
+            pass
+    return entries
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) != 2 or sys.argv[1] not in ("info", "clear"):
+        print("Usage: python cache.py <info|clear>")
+        sys.exit(1)
+
+    if sys.argv[1] == "info":
+        cache_info = info()
+        print(f"{CACHE_DIR}: {cache_info['entries']} souborů, {cache_info['bytes'] / 2**20:.1f} MB")
+    else:
+        print(f"Odstraněno {clear()} souborů z {CACHE_DIR}.")
@@ -1,46 +1,264 @@
 import os
+import sys
 import json
+import pickle
+import hashlib
+import dataclasses
 
-from constants import MAPPING_DIR as _MAPPING_DIR
-
-
-mappings = [
-    os.path.join(_MAPPING_DIR, filename)
-    for filename in os.listdir(_MAPPING_DIR)
-    if filename.endswith(".json")
-]
-MAPPING: dict[str, dict[str, str] | list[str]] = {}
-for path in mappings:
-    with open(path, "r", encoding="utf-8") as f:
-        curr_mapping: dict[str, dict[str, str]] = dict(json.load(f))
-        orig_partial = dict(curr_mapping["partial"])
-        for key in orig_partial:
-            curr_mapping["partial"][key.lower()] = curr_mapping["partial"].pop(key)
-    for key in ["exact", "partial", "category_replace"]:
-        if not key in MAPPING:
-            MAPPING[key] = {}
-        MAPPING[key].update(curr_mapping[key])
-    if not "skip" in MAPPING:
-        MAPPING["skip"] = []
-    MAPPING["skip"].extend(curr_mapping["skip"])
+from constants import MAPPING_DIR as _MAPPING_DIR, CATEGORY_CACHE_SIZE, CACHE_DIR
+from matcher import PatternMatcher
+from utils import LRUCache
+
+
+_SNAPSHOT_PATH = os.path.join(CACHE_DIR, "mapping.snapshot")
+# Change whenever CompiledMapping or PatternMatcher changes, as cache.CACHE_FORMAT
+_SNAPSHOT_FORMAT = 1
+
+
+@dataclasses.dataclass(frozen=True)
+class CompiledMapping:
+    """The merged mapping together with the structures derived from it."""
+
+    mapping: dict[str, dict[str, str] | list[str]]
+    fingerprint: str
+    partial_matcher: PatternMatcher
+    skip: frozenset[str]
+    # Name, modification time and size of the mapping files the mapping was merged from
+    sources: tuple[tuple[str, int, int], ...] = ()
+
+
+_COMPILED: CompiledMapping | None = None
+_CATEGORY_CACHE = LRUCache(CATEGORY_CACHE_SIZE)
+
+
+def __getattr__(name: str):
+    # The mapping is loaded only when it is needed for the first time
+    if name == "MAPPING":
+        return (_COMPILED or load_mapping()).mapping
+    if name == "MAPPING_FINGERPRINT":
+        return (_COMPILED or load_mapping()).fingerprint
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def mapping_fingerprint(mapping: dict) -> str:
+    """Returns a digest identifying the content (including the rule order) of the mapping."""
+    return hashlib.sha1(json.dumps(mapping, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def load_mapping() -> CompiledMapping:
+    """
+    Loads the mapping files. The compiled mapping is reused from the snapshot stored
+    by a previous load, if the mapping files have not changed since.
+    """
+    global _COMPILED
+    sources = _mapping_sources()
+    compiled = _load_snapshot()
+    if compiled is None or compiled.sources != sources:
+        compiled = compile_mapping(sources)
+        _store_snapshot(compiled)
+    _COMPILED = compiled
+    return compiled
+
+
+def compile_mapping(sources: tuple[tuple[str, int, int], ...]) -> CompiledMapping:
+    """Merges the mapping files in the given order."""
+    mapping: dict[str, dict[str, str] | list[str]] = {}
+    for filename, _, _ in sources:
+        with open(os.path.join(_MAPPING_DIR, filename), "r", encoding="utf-8") as f:
+            curr_mapping: dict[str, dict[str, str]] = dict(json.load(f))
+            orig_partial = dict(curr_mapping["partial"])
+            for key in orig_partial:
+                curr_mapping["partial"][key.lower()] = curr_mapping["partial"].pop(key)
+        for key in ["exact", "partial", "category_replace"]:
+            if not key in mapping:
+                mapping[key] = {}
+            mapping[key].update(curr_mapping[key])
+        if not "skip" in mapping:
+            mapping["skip"] = []
+        mapping["skip"].extend(curr_mapping["skip"])
+    return CompiledMapping(
+        mapping=mapping,
+        fingerprint=mapping_fingerprint(mapping),
+        partial_matcher=PatternMatcher(mapping["partial"]),
+        skip=frozenset(mapping["skip"]),
+        sources=sources,
+    )
+
+
+def _mapping_sources() -> tuple[tuple[str, int, int], ...]:
+    sources = []
+    for filename in os.listdir(_MAPPING_DIR):
+        if filename.endswith(".json"):
+            stat = os.stat(os.path.join(_MAPPING_DIR, filename))
+            sources.append((filename, stat.st_mtime_ns, stat.st_size))
+    return tuple(sources)
+
+
+def _load_snapshot() -> CompiledMapping | None:
+    try:
+        with open(_SNAPSHOT_PATH, "rb") as file:
+            snapshot = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, TypeError):
+        return None
+    if not (isinstance(snapshot, tuple) and len(snapshot) == 2):
+        # Written before the format was stored
+        return None
+    snapshot_format, compiled = snapshot
+    if snapshot_format != _SNAPSHOT_FORMAT or not isinstance(compiled, CompiledMapping):
+        return None
+    return compiled
+
+
+def _store_snapshot(compiled: CompiledMapping) -> None:
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(_SNAPSHOT_PATH + ".tmp", "wb") as file:
+            pickle.dump((_SNAPSHOT_FORMAT, compiled), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(_SNAPSHOT_PATH + ".tmp", _SNAPSHOT_PATH)
+    except OSError:
+        # The snapshot only speeds up the next start
+        pass
+
+
+@dataclasses.dataclass(frozen=True)
+class MappingChange:
+    """Rules differing between two versions of the mapping."""
+
+    exact: frozenset[str]
+    partial: PatternMatcher
+    # Categories whose replacement may have changed
+    replaced: frozenset[str]
+    skip: bool
+
+    @classmethod
+    def between(cls, old: CompiledMapping, new: CompiledMapping) -> "MappingChange":
+        def changed(kind: str) -> set[str]:
+            old_rules, new_rules = old.mapping.get(kind, {}), new.mapping.get(kind, {})
+            return {
+                key
+                for key in old_rules.keys() | new_rules.keys()
+                if old_rules.get(key) != new_rules.get(key)
+            }
+
+        partial = changed("partial")
+        old_partial, new_partial = old.mapping.get("partial", {}), new.mapping.get("partial", {})
+        old_order = [pattern for pattern in old_partial if pattern in new_partial]
+        new_order = [pattern for pattern in new_partial if pattern in old_partial]
+        if old_order != new_order:
+            # The first matching pattern wins, reordering may change any partial match
+            partial = old_partial.keys() | new_partial.keys()
+
+        old_replace = old.mapping.get("category_replace", {})
+        new_replace = new.mapping.get("category_replace", {})
+        replaced = set()
+        for category in changed("category_replace"):
+            replaced.update({category, old_replace.get(category), new_replace.get(category)})
+        # The replacement may be applied twice (see read.categorize)
+        replaced.update([old_replace[category] for category in replaced if category in old_replace])
+        replaced.discard(None)
+
+        return cls(
+            exact=frozenset(changed("exact")),
+            partial=PatternMatcher(partial),
+            replaced=frozenset(replaced),
+            skip=old.skip != new.skip,
+        )
+
+    def affects(self, keys: tuple[str, ...], category: str) -> bool:
+        """Checks, if the category of the transaction with the normalized keys may have changed."""
+        if category in self.replaced:
+            return True
+        for key in keys:
+            if key in self.exact or self.partial.first_match(key.lower()) is not None:
+                return True
+        return False
+
+
+def reload_mapping() -> MappingChange | None:
+    """Reloads the mapping, if the mapping files have changed. Returns the change of the rules."""
+    global _COMPILED
+    if _COMPILED is None:
+        load_mapping()
+        return None
+    old = _COMPILED
+    sources = _mapping_sources()
+    if sources == old.sources:
+        return None
+    _COMPILED = compile_mapping(sources)
+    _store_snapshot(_COMPILED)
+    return MappingChange.between(old, _COMPILED)
+
+
+def fingerprint() -> str:
+    """Returns the fingerprint of the currently loaded mapping."""
+    return (_COMPILED or load_mapping()).fingerprint
+
+
+def skipped_categories() -> frozenset[str]:
+    """Returns the categories excluded from the totals."""
+    return (_COMPILED or load_mapping()).skip
+
+
+def export_mapping() -> CompiledMapping:
+    """Returns the loaded mapping in a picklable form, e.g. to be passed to worker processes."""
+    return _COMPILED or load_mapping()
+
+
+def install_mapping(compiled: CompiledMapping) -> None:
+    """Replaces the loaded mapping by one returned from `export_mapping`."""
+    global _COMPILED
+    _COMPILED = compiled
+
+
+def cache_stats() -> dict[str, int]:
+    """Returns the hit/miss/eviction counters of the category cache."""
+    return _CATEGORY_CACHE.stats()
+
+
+def clear_cache() -> None:
+    _CATEGORY_CACHE.clear()
+
+
+def normalize_keys(*keys: str) -> tuple[str, ...]:
+    """Strips the keys and drops the empty ones."""
+    return tuple([key.strip() for key in keys if key.strip()])
 
 
 def get_category(*keys: str) -> str:
     """Gets the category for a given key based on the mapping."""
-    keys = tuple([key.strip() for key in keys if key.strip()])
+    return resolve_category(*keys)[0]
+
+
+def resolve_category(*keys: str) -> tuple[str, str]:
+    """
+    Gets the category for a given key based on the mapping, together with the kind
+    of the rule it was resolved by ("exact", "partial" or "unresolved").
+    """
+    keys = normalize_keys(*keys)
+    compiled = _COMPILED or load_mapping()
+    _CATEGORY_CACHE.bind(compiled.fingerprint)
+    resolved = _CATEGORY_CACHE.get(keys)
+    if resolved is None:
+        resolved = _resolve_category(compiled, keys)
+        _CATEGORY_CACHE.put(keys, resolved)
+    return resolved
+
+
+def _resolve_category(compiled: CompiledMapping, keys: tuple[str, ...]) -> tuple[str, str]:
     for key in keys:
-        category = MAPPING["exact"].get(key, "")
+        category = compiled.mapping["exact"].get(key, "")
+        outcome = "exact"
         if not category:
             # There is no exact match, try partial matches
-            for pattern in MAPPING["partial"]:
-                if pattern in key.lower():
-                    category = MAPPING["partial"][pattern]
-                    break
+            pattern = compiled.partial_matcher.first_match(key.lower())
+            if pattern is not None:
+                category = compiled.mapping["partial"][pattern]
+                outcome = "partial"
         if category:
-            return replace_category(category)
-    return f"Nezařazeno {keys}"
+            return replace_category(category), outcome
+    return sys.intern(f"Nezařazeno {keys}"), "unresolved"
 
 
 def replace_category(old: str) -> str:
     """Replaces category in the transaction, if the replacement exists in the mapping."""
-    return MAPPING["category_replace"].get(old, "") or old
+    return (_COMPILED or load_mapping()).mapping["category_replace"].get(old, "") or old
@@ -1,48 +1,201 @@
+"""
+Combines the summaries written by `write.write_summary`.
+
+Usage:
+    python comb.py [--workers N] <summary1.json> <summary2.json> ...
+    python comb.py --append <summary.json>
+
+The amounts are summed as integers in haléře, so the summaries can be read by N processes
+and merged in any grouping with the same result. The state of the combination is kept in
+combined_summary.state.json, --append adds a summary to it without reading the others again.
+"""
+
+import os
 import sys
 import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+
+
+COMBINED_PATH = "combined_summary.json"
+STATE_PATH = "combined_summary.state.json"
+# Change whenever the content of the state file changes
+_STATE_FORMAT = 1
+_AMOUNT_KEYS = ("příjmy", "výdaje", "celkem")
+_TOTAL_KEYS = ("příjmy", "výdaje", "zůstatek")
+
+
+def combine_summaries(*paths: str, workers: int = 1) -> dict:
+    return finish(reduce_summaries(paths, workers))
+
+
+def combine(summaries: Iterable[dict]) -> dict:
+    """
+    Combines summaries in the format of `write.summary_dict`. The amounts are summed as
+    integers in haléře, so the totals do not depend on the number of summaries.
+    """
+    return finish(_tree_reduce([to_partial(summary) for summary in summaries]))
+
+
+def to_partial(summary: dict) -> dict:
+    """
+    Converts the summary to a partial combination: the amounts in haléře and the neutral
+    categories as the keys of a dict (an ordered set).
+    """
+    partial: dict[str, dict] = {
+        key: {k: round(v * 100) for k, v in summary.get(key, {}).items()} for key in _AMOUNT_KEYS
+    }
+    partial["neutrální"] = dict.fromkeys(summary.get("neutrální", []))
+    return partial
+
+
+def merge(partial: dict, other: dict) -> dict:
+    """
+    Adds the other partial combination to the first one and returns it. The merge is
+    associative, the categories keep the order of their first appearance.
+    """
+    for key in _AMOUNT_KEYS:
+        amounts = partial[key]
+        for category, amount in other[key].items():
+            amounts[category] = amounts.get(category, 0) + amount
+    partial["neutrální"].update(other["neutrální"])
+    return partial
+
+
+def finish(partial: dict) -> dict:
+    """Converts the partial combination to the combined summary."""
+    return {
+        "příjmy": {k: v / 100 for k, v in partial["příjmy"].items()},
+        "výdaje": {k: v / 100 for k, v in partial["výdaje"].items()},
+        "neutrální": list(partial["neutrální"]),
+        "celkem": {
+            **{key: 0.0 for key in _TOTAL_KEYS},
+            **{k: v / 100 for k, v in partial["celkem"].items()},
+        },
+    }
+
 
+def reduce_summaries(paths: Iterable[str], workers: int = 1) -> dict:
+    """
+    Reads the summaries and merges them to a partial combination. With more than one
+    worker, the processes reduce contiguous chunks of the paths and the chunks are merged
+    pairwise.
+    """
+    paths = list(paths)
+    if workers > 1 and len(paths) > 1:
+        size = -(-len(paths) // workers)
+        chunks = [paths[i : i + size] for i in range(0, len(paths), size)]
+        with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+            return _tree_reduce(list(executor.map(_reduce_chunk, chunks)))
+    return _reduce_chunk(paths)
 
-def combine_summaries(*paths: str) -> dict:
-    combined_summary: dict[str, dict | list] = {}
+
+def _reduce_chunk(paths: list[str]) -> dict:
+    partial = to_partial({})
     for path in paths:
-        with open(path, "r", encoding="utf-8") as file:
-            summary = json.load(file)
-            add_summary(combined_summary, summary)
-    combined_summary["neutrální"] = list(combined_summary["neutrální"])
-    return combined_summary
-
-
-def add_summary(combined: dict, summary: dict) -> None:
-    combined["příjmy"] = combined.get("příjmy", {})
-    combined["výdaje"] = combined.get("výdaje", {})
-    for key in ["příjmy", "výdaje"]:
-        if key not in combined:
-            combined[key] = {}
-        for category, amount in summary.get(key, {}).items():
-            if category in combined[key]:
-                combined[key][category] = round(amount + combined[key][category], 2)
-            else:
-                combined[key][category] = amount
-    if "neutrální" not in combined:
-        combined["neutrální"] = set()
-    if not "celkem" in combined:
-        combined["celkem"] = {"příjmy": 0.0, "výdaje": 0.0, "balance": 0.0}
-    for total_key in ["příjmy", "výdaje", "balance"]:
-        combined["celkem"][total_key] = round(
-            combined["celkem"].get(total_key, 0.0) + summary.get("celkem", {}).get(total_key, 0.0),
-            2,
-        )
-    combined["neutrální"].update(summary.get("neutrální", []))
+        merge(partial, to_partial(_load(path)))
+    return partial
+
+
+def _tree_reduce(partials: list[dict]) -> dict:
+    while len(partials) > 1:
+        pairs = range(0, len(partials) - 1, 2)
+        merged = [merge(partials[i], partials[i + 1]) for i in pairs]
+        partials = merged + partials[len(merged) * 2 :]
+    return partials[0] if partials else to_partial({})
+
+
+def input_digests(paths: Iterable[str]) -> dict[str, str]:
+    """Returns the digests of the input summaries, as kept in the state of the combination."""
+    return {os.path.abspath(path): _digest(path) for path in paths}
+
+
+def write_combined(
+    partial: dict,
+    inputs: dict[str, str],
+    combined_path: str = COMBINED_PATH,
+    state_path: str = STATE_PATH,
+) -> None:
+    """
+    Writes the combined summary and the state of the combination of the input summaries
+    (`input_digests`). Both files are written to temporary files first and replaced only
+    when both are complete.
+    """
+    combined = json.dumps(finish(partial), ensure_ascii=False, indent=4).encode("utf-8")
+    state = {
+        "format": _STATE_FORMAT,
+        "output": hashlib.sha1(combined).hexdigest(),
+        "inputs": inputs,
+        "partial": {**partial, "neutrální": list(partial["neutrální"])},
+    }
+    with open(combined_path + ".tmp", "wb") as json_file:
+        json_file.write(combined)
+    with open(state_path + ".tmp", "w", encoding="utf-8") as state_file:
+        json.dump(state, state_file, ensure_ascii=False)
+    os.replace(state_path + ".tmp", state_path)
+    os.replace(combined_path + ".tmp", combined_path)
+
+
+def append_summary(
+    path: str, combined_path: str = COMBINED_PATH, state_path: str = STATE_PATH
+) -> bool:
+    """
+    Adds the summary to the combined summary using the state of the combination. Returns
+    False if the summary has already been added.
+    """
+    try:
+        with open(state_path, "r", encoding="utf-8") as state_file:
+            state = json.load(state_file)
+    except FileNotFoundError:
+        raise ValueError(f"Chybí stav kombinace {state_path}, spusťte celou kombinaci.")
+    if state.get("format") != _STATE_FORMAT or state["output"] != _digest(combined_path):
+        raise ValueError(f"{combined_path} neodpovídá stavu kombinace, spusťte celou kombinaci.")
+    inputs: dict[str, str] = state["inputs"]
+    digest = _digest(path)
+    previous = inputs.get(os.path.abspath(path))
+    if previous == digest:
+        return False
+    if previous is not None:
+        raise ValueError(f"Souhrn {path} se od kombinace změnil, spusťte celou kombinaci.")
+
+    partial = state["partial"]
+    partial["neutrální"] = dict.fromkeys(partial["neutrální"])
+    merge(partial, to_partial(_load(path)))
+    # Only the new summary is read, the earlier ones are known by their digests
+    write_combined(partial, {**inputs, os.path.abspath(path): digest}, combined_path, state_path)
+    return True
+
+
+def _load(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _digest(path: str) -> str:
+    with open(path, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()
 
 
 if __name__ == "__main__":
 
-    if len(sys.argv) < 2:
-        print("Usage: python comb.py <summary1.json> <summary2.json> ...")
-        sys.exit(1)
+    args = sys.argv[1:]
+    if len(args) == 2 and args[0] == "--append":
+        try:
+            if not append_summary(args[1]):
+                print(f"Souhrn {args[1]} už je v kombinaci zahrnut.")
+        except (OSError, ValueError) as e:
+            print(e)
+            sys.exit(1)
+        sys.exit(0)
 
-    combined = combine_summaries(*sys.argv[1:])
+    workers = 1
+    if "--workers" in args:
+        i = args.index("--workers")
+        workers = int(args[i + 1])
+        del args[i : i + 2]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
 
-    json_output_path = "combined_summary.json"
-    with open(json_output_path, "w", encoding="utf-8") as json_file:
-        json.dump(combined, json_file, ensure_ascii=False, indent=4)
+    write_combined(reduce_summaries(args, workers), input_digests(args))
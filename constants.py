@@ -1 +1,4 @@
 MAPPING_DIR = "mapping"
+CATEGORY_CACHE_SIZE = 65536
+CACHE_DIR = ".cache"
+CACHE_MAX_BYTES = 256 * 2**20
@@ -0,0 +1,214 @@
+"""
+Keeps the outputs of a data subfolder up to date while new exports arrive, and serves the
+current summary over HTTP on localhost. New files are read and added to the totals, the
+files already read are not read again unless they change or disappear (then the data are
+rebuilt, from the on-disk cache where possible). Mapping changes are applied as by watch.py.
+
+The transfers of new files are matched only against the transfers unmatched so far (the
+pairs already made are kept), and the new transactions are appended to the details, which
+are written in ndjson for that. The outputs are rewritten as a whole only after a mapping
+change or a changed or removed file.
+
+Usage: python daemon.py <data_subfolder> [days] [port]
+
+    GET /summary    the summary, as in "summary <name>.json"
+    GET /status     the number of files and transactions and the time of the last update
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from constants import MAPPING_DIR
+from categories import reload_mapping
+from dedup import Deduplicator
+from read import DATA_PARENT, Transaction, load_data, collect_csv_paths
+from matching import match_transfers
+from watch import POLL_INTERVAL, CategorizedData
+from write import append_details, write_details, write_matching, write_summary, summary_dict
+import run
+
+
+DEFAULT_PORT = 8765
+
+
+class DataFolder:
+    """Deduplicated transactions of the files of a data subfolder, kept in step with the files."""
+
+    def __init__(self, data_subfolder: str, days: int) -> None:
+        self.data_subfolder = data_subfolder
+        self.days = days
+        # Modification time and size of the files read
+        self.files: dict[str, tuple[int, int]] = {}
+        self.deduplicator = Deduplicator()
+        self.state = CategorizedData([], days)
+        self.matched: list[tuple[Transaction, Transaction]] = []
+        self.unmatched: list[Transaction] = []
+
+    def refresh(self) -> tuple[list[str], list[str], list[Transaction]]:
+        """
+        Reads the new and changed files. Returns the paths of the files read and of the
+        changed or removed files, and the transactions added (all of them if some files
+        changed or were removed).
+        """
+        signatures = {path: _signature(path) for path in collect_csv_paths(self.data_subfolder)}
+        stale = [path for path, known in self.files.items() if signatures.get(path) != known]
+        if stale:
+            # Duplicates cannot be counted back, so the remaining files are deduplicated again
+            self.files = {}
+            self.deduplicator = Deduplicator()
+            self.state = CategorizedData([], self.days)
+        read = [path for path in signatures if path not in self.files]
+        added: list[Transaction] = []
+        for path in read:
+            transactions = list(self.deduplicator.filter(path, load_data(path, use_cache=True)))
+            self.state.extend(transactions)
+            added.extend(transactions)
+            self.files[path] = signatures[path]
+        return read, stale, added
+
+    def match_transfers(self, transactions: list[Transaction]) -> None:
+        """Matches the transfers among the transactions with the transfers unmatched so far."""
+        transfers = [t for t in transactions if t.category == "Převod"]
+        if transfers:
+            matched, self.unmatched = match_transfers(
+                self.unmatched + transfers,
+                max_days=run.TRANSFER_MAX_DAYS,
+                prefer_other_bank=run.TRANSFER_PREFER_OTHER_BANK,
+            )
+            self.matched.extend(matched)
+
+    def rematch_transfers(self) -> None:
+        self.matched, self.unmatched = [], []
+        self.match_transfers(self.state.data)
+
+    def snapshots(self) -> dict[str, bytes]:
+        """Returns the responses of the query interface."""
+        status = {
+            "soubory": len(self.files),
+            "transakce": len(self.state.data),
+            "duplicity": sum(self.deduplicator.dropped.values()),
+            "aktualizováno": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        return {
+            "/summary": _json(summary_dict(self.state.result())),
+            "/status": _json(status),
+        }
+
+
+def _signature(path: str) -> tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _json(obj: object) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, indent=4).encode("utf-8")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Replaced as a whole after every update, the handlers never see a partial update
+    snapshots: dict[str, bytes] = {}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: _Server
+
+    def do_GET(self) -> None:
+        body = self.server.snapshots.get(self.path.split("?")[0].rstrip("/"))
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+def _write(folder: DataFolder, name: str, added: list[Transaction] | None = None) -> None:
+    """Writes the outputs, only appending the `added` transactions to the details if given."""
+    # As run.py, the matching is written only if some transfers are unmatched
+    if folder.unmatched:
+        write_matching(folder.matched, folder.unmatched)
+    if added is None:
+        write_details(folder.state.data, name, "ndjson")
+    elif added:
+        append_details(added, name)
+    write_summary(folder.state.result(), name)
+
+
+def serve(data_subfolder: str, days: int, port: int = DEFAULT_PORT) -> None:
+    name = os.path.basename(os.path.normpath(data_subfolder))
+    folder = DataFolder(data_subfolder, days)
+    folder.refresh()
+    reload_mapping()
+    folder.rematch_transfers()
+    _write(folder, name)
+
+    server = _Server(("127.0.0.1", port), _Handler)
+    server.snapshots = folder.snapshots()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(
+        f"Sleduji '{os.path.join(DATA_PARENT, data_subfolder)}' a '{MAPPING_DIR}' "
+        f"({len(folder.state.data)} transakcí), souhrn na http://127.0.0.1:{port}/summary, "
+        "ukončení Ctrl+C."
+    )
+
+    # Whether the outputs are behind the data and have to be rewritten as a whole
+    pending = False
+    while True:
+        time.sleep(POLL_INTERVAL)
+        start = time.perf_counter()
+        try:
+            change = reload_mapping()
+        except (OSError, ValueError, KeyError) as e:
+            # Possibly a mapping file still being saved, the previous mapping is kept
+            print(f"Varování: Mapování nelze načíst: {e}")
+            continue
+        changed = folder.state.apply(change) if change is not None else []
+        pending = pending or bool(changed) or (change is not None and change.skip)
+        try:
+            read, stale, added = folder.refresh()
+        except (OSError, ValueError) as e:
+            # Possibly a file still being written, tried again in the next round. The files
+            # read before the error are in the data but not in the outputs.
+            print(f"Varování: {e}")
+            pending = True
+            continue
+        if not (pending or read or stale):
+            continue
+        if pending or stale:
+            folder.rematch_transfers()
+            _write(folder, name)
+        else:
+            folder.match_transfers(added)
+            _write(folder, name, added)
+        pending = False
+        server.snapshots = folder.snapshots()
+        print(
+            f"Aktualizace: načteno {len(read)} souborů, změněno nebo odebráno {len(stale)}, "
+            f"přeřazeno {len(changed)} transakcí za {time.perf_counter() - start:.3f} s."
+        )
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2:
+        print("Usage: python daemon.py <data_subfolder> [days] [port]")
+        sys.exit(1)
+
+    try:
+        serve(
+            sys.argv[1],
+            int(sys.argv[2]) if len(sys.argv) > 2 else 30,
+            int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_PORT,
+        )
+    except KeyboardInterrupt:
+        pass
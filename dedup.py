@@ -0,0 +1,71 @@
+"""
+Removal of the transactions repeated in exports with overlapping date ranges.
+"""
+
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+from utils import date_ordinal
+
+if TYPE_CHECKING:
+    from read import Transaction
+
+
+# Days before the latest date of a bank whose fingerprints are kept
+WINDOW_DAYS = 366
+
+
+class Deduplicator:
+    """
+    Drops the transactions already read from other files. A transaction is identified by
+    a 64-bit fingerprint of its bank, date, amount and info, so the index takes the same
+    memory per transaction whatever the length of the info. Identical transactions within
+    one file are all kept: the n-th occurrence in a file is dropped only if some previous
+    file contained at least n of them.
+
+    Exports overlap only with the exports of the same bank from adjacent date ranges, so
+    after a file is read, the fingerprints of the banks dated more than WINDOW_DAYS before
+    the latest date read of the bank are forgotten. The index is thus bounded by about a year
+    of transactions per bank however long the history, whatever the order of the files (the
+    transactions with unrecognized dates are always kept). Only the transactions older than
+    the window are not deduplicated against each other.
+    """
+
+    def __init__(self) -> None:
+        # Greatest number of occurrences of the fingerprint in a single file read so far,
+        # by bank and date ordinal (None for unrecognized dates)
+        self._seen: dict[str, dict[int | None, dict[int, int]]] = {}
+        # Latest date ordinal read by bank
+        self._latest: dict[str, int] = {}
+        self.dropped: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return sum(len(day) for days in self._seen.values() for day in days.values())
+
+    def filter(
+        self, file_path: str, transactions: Iterable["Transaction"]
+    ) -> Iterator["Transaction"]:
+        """Yields the transactions of the file not read before and counts the dropped ones."""
+        counts: dict[int, int] = {}
+        self.dropped[file_path] = 0
+        # Fingerprints of the day of the transaction, by its bank and date as in the file
+        days: dict[tuple[str, str], dict[int, int]] = {}
+        for transaction in transactions:
+            bank, date = transaction.bank, transaction.date
+            key = hash((bank, date, transaction.amount, transaction.info))
+            seen = days.get((bank, date))
+            if seen is None:
+                ordinal = date_ordinal(date)
+                seen = days[bank, date] = self._seen.setdefault(bank, {}).setdefault(ordinal, {})
+                if ordinal is not None and ordinal > self._latest.get(bank, ordinal - 1):
+                    self._latest[bank] = ordinal
+            count = counts.get(key, 0) + 1
+            counts[key] = count
+            if count > seen.get(key, 0):
+                seen[key] = count
+                yield transaction
+            else:
+                self.dropped[file_path] += 1
+        for bank in {bank for bank, _ in days}:
+            by_day, oldest = self._seen[bank], self._latest.get(bank, 0) - WINDOW_DAYS
+            for ordinal in [d for d in by_day if d is not None and d < oldest]:
+                del by_day[ordinal]
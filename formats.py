@@ -0,0 +1,165 @@
+"""
+Formats of the bank exports. A new bank needs only a new entry in FORMATS.
+"""
+
+import os
+import dataclasses
+from typing import Iterable, Iterator
+
+from utils import iter_lines, iter_from_start_with
+
+
+# Size of the beginning of a file the format is detected from
+SNIFF_BYTES = 4096
+
+
+@dataclasses.dataclass(frozen=True)
+class ColumnPlan:
+    """Indices of the columns of a format in a particular header."""
+
+    amount: int
+    date: int
+    keys: tuple[int, ...]
+    info: tuple[int, ...]
+    category: int | None
+    width: int
+
+
+@dataclasses.dataclass(frozen=True)
+class BankFormat:
+    """
+    Format of the export of a bank. The header is either on the line `header_line`
+    (numbered from 1) or on the first line beginning with `header_start`. The columns are
+    named as in the header, compared case insensitively.
+    """
+
+    bank: str
+    label: str
+    # Beginning of the file names of the exports, used if the content is not recognized
+    prefix: str
+    amount: str
+    date: str
+    # Columns with the inputs of the categorization, in the order of their priority
+    keys: tuple[str, ...]
+    # Columns describing the transaction, the first non-empty one is used
+    info: tuple[str, ...]
+    # Column with the bank's own category, used if the keys are not in the mapping
+    category: str | None = None
+    header_line: int = 1
+    header_start: str | None = None
+    encoding: str = "utf-8"
+    delimiter: str = ";"
+    # Characters stripped from the info
+    info_strip: str | None = None
+    # Check that the first row has as many fields as the header
+    check_width: bool = False
+
+    def rows(self, file: Iterable[str]) -> Iterator[list[str]]:
+        """Yields the split rows of the file, starting with the header."""
+        if self.header_start is not None:
+            return iter_from_start_with(file, self.header_start, delimiter=self.delimiter)
+        return iter_lines(file, first=self.header_line, delimiter=self.delimiter)
+
+    def plan(self, header: list[str]) -> ColumnPlan:
+        """Finds the columns of the format in the header."""
+        index: dict[str, int] = {}
+        for i, name in enumerate(header):
+            index.setdefault(name.lower().strip(), i)
+
+        def column(name: str) -> int:
+            try:
+                return index[name.lower().strip()]
+            except KeyError:
+                raise ValueError(f"Column '{name}' not found in header. Header: {list(index)}")
+
+        return ColumnPlan(
+            amount=column(self.amount),
+            date=column(self.date),
+            keys=tuple(column(name) for name in self.keys),
+            info=tuple(column(name) for name in self.info),
+            category=column(self.category) if self.category is not None else None,
+            width=len(header),
+        )
+
+    def matches(self, head: str) -> bool:
+        """Whether the beginning of a file is in the format."""
+        lines = head.splitlines()
+        if self.header_start is not None:
+            lines = [line for line in lines if line.startswith(self.header_start)][:1]
+        else:
+            lines = lines[self.header_line - 1 : self.header_line]
+        if not lines:
+            return False
+        try:
+            self.plan(next(iter_lines(lines, delimiter=self.delimiter)))
+        except ValueError:
+            return False
+        return True
+
+
+FORMATS: tuple[BankFormat, ...] = (
+    BankFormat(
+        bank="csob",
+        label="CSOB Bank",
+        prefix="csob",
+        amount="Částka",
+        date="datum zaúčtování",
+        keys=("jméno protistrany", "vlastní poznámka", "zpráva", "číslo protiúčtu"),
+        info=("jméno protistrany", "číslo protiúčtu", "zpráva"),
+        category="Kategorie",
+        header_line=3,
+    ),
+    BankFormat(
+        bank="raiffeisenbank",
+        label="Reiff Bank",
+        prefix="raif",
+        amount="Zaúčtovaná částka",
+        date="Datum zaúčtování",
+        keys=("Název obchodníka", "Poznámka", "Název protiúčtu", "Číslo protiúčtu"),
+        info=("Název protiúčtu", "Poznámka", "Číslo protiúčtu"),
+    ),
+    BankFormat(
+        bank="creditas",
+        label="Creditas Bank",
+        prefix="cred",
+        amount="Částka",
+        date="Datum zaúčtování",
+        keys=("Název protiúčtu", "Protiúčet", "Zpráva pro protistranu"),
+        info=("Název protiúčtu", "Protiúčet", "Zpráva pro protistranu"),
+        category="Kategorie",
+        header_start="Můj účet",
+        encoding="utf-8-sig",
+    ),
+    BankFormat(
+        bank="unicreditbank",
+        label="Unicredit Bank",
+        prefix="unic",
+        amount="Částka",
+        date="Datum rezervace",
+        keys=("Příjemce", "Detaily transakce 1"),
+        info=("Příjemce", "Detaily transakce 1"),
+        header_line=4,
+        info_strip='", ',
+        check_width=True,
+    ),
+)
+
+
+def detect_format(file_path: str) -> BankFormat | None:
+    """
+    Detects the format of the file from its beginning. The format given by the file name
+    is tried first and it is used even if the content is not recognized.
+    """
+    base = os.path.basename(file_path).lower()
+    by_name = next((f for f in FORMATS if base.startswith(f.prefix)), None)
+    with open(file_path, "rb") as file:
+        head = file.read(SNIFF_BYTES)
+        complete = not file.read(1)
+    if not complete:
+        # The last line may be cut
+        head = head[: head.rfind(b"\n") + 1]
+    candidates = ([by_name] if by_name else []) + [f for f in FORMATS if f is not by_name]
+    for bank_format in candidates:
+        if bank_format.matches(head.decode(bank_format.encoding, errors="replace")):
+            return bank_format
+    return by_name
@@ -0,0 +1,131 @@
+"""
+Lightweight instrumentation of the pipeline: wall time of the stages and of reading the
+source files, split into the disk reads, the splitting and parsing of the rows and their
+categorization, counters and output sizes. Enabled by the FINANCE_PROFILE environment
+variable or by `enable()`. When disabled, the hot paths only check the ENABLED flag.
+
+The measurements are recorded in the process doing the work, files read by worker
+processes (`load_data(..., workers=N)`) are not included.
+"""
+
+import os
+import json
+import time
+from collections import Counter, defaultdict
+from typing import Any
+
+
+ENABLED = os.environ.get("FINANCE_PROFILE", "") not in ("", "0")
+
+_stages: dict[str, float] = defaultdict(float)
+_files: dict[str, dict[str, Any]] = {}
+_file_parts: dict[str, dict[str, float]] = {}
+_counters: Counter[str] = Counter()
+_outputs: dict[str, int] = {}
+_pipeline: dict[str, Any] = {}
+
+
+def enable(enabled: bool = True) -> None:
+    global ENABLED
+    ENABLED = enabled
+
+
+def reset() -> None:
+    _stages.clear()
+    _files.clear()
+    _file_parts.clear()
+    _counters.clear()
+    _outputs.clear()
+    _pipeline.clear()
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> "_Stage":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        _stages[self.name] += time.perf_counter() - self.start
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoStage":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name: str) -> _Stage | _NoStage:
+    """Returns a context manager adding the wall time of the block to the stage."""
+    return _Stage(name) if ENABLED else _NO_STAGE
+
+
+def count(name: str, n: int = 1) -> None:
+    if ENABLED:
+        _counters[name] += n
+
+
+def record_file(path: str, bank: str, rows: int, seconds: float, cached: bool = False) -> None:
+    if ENABLED:
+        _files[path] = {"bank": bank, "rows": rows, "seconds": seconds, "cached": cached}
+
+
+def record_file_parts(path: str, **seconds: float) -> None:
+    """Records the wall time of the parts of reading the file, e.g. `read`, `decode`."""
+    if ENABLED:
+        _file_parts[path] = {f"{part}_seconds": value for part, value in seconds.items()}
+
+
+def record_output(path: str) -> None:
+    if ENABLED:
+        _outputs[path] = os.path.getsize(path)
+
+
+def record_pipeline(stats: dict[str, Any]) -> None:
+    """Records the queue depths and waits of the pipelined loading (see pipeline.py)."""
+    if ENABLED:
+        _pipeline.update(stats)
+
+
+def report() -> dict[str, Any]:
+    rows: Counter[str] = Counter()
+    seconds: Counter[str] = Counter()
+    parts: Counter[str] = Counter()
+    for file_parts in _file_parts.values():
+        parts.update(file_parts)
+    for file in _files.values():
+        if not file["cached"]:
+            rows[file["bank"]] += file["rows"]
+            seconds[file["bank"]] += file["seconds"]
+    return {
+        "stages": dict(_stages),
+        "files": {
+            path: {**_files.get(path, {}), **_file_parts.get(path, {})}
+            for path in dict.fromkeys([*_files, *_file_parts])
+        },
+        "file_parts": dict(parts),
+        "rows_per_second": {
+            bank: rows[bank] / seconds[bank] for bank in rows if seconds[bank] > 0
+        },
+        "counters": dict(_counters),
+        "output_bytes": dict(_outputs),
+        **({"pipeline": dict(_pipeline)} if _pipeline else {}),
+    }
+
+
+def write_report(name: str, extra: dict[str, Any] | None = None) -> None:
+    """Writes the report next to the summary files."""
+    with open(f"profile {name}.json", "w", encoding="utf-8") as file:
+        json.dump({**report(), **(extra or {})}, file, ensure_ascii=False, indent=4)
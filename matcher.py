@@ -0,0 +1,66 @@
+from collections import deque
+from typing import Iterable
+
+
+class PatternMatcher:
+    """
+    Aho-Corasick automaton over an ordered collection of substring patterns.
+    A single pass over the text finds the pattern that comes first in the original
+    order among all patterns contained in the text, i.e. the same pattern a linear
+    scan `for pattern in patterns: if pattern in text` would stop at.
+    """
+
+    __slots__ = ("patterns", "_goto", "_fail", "_best")
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self.patterns: list[str] = list(patterns)
+        none = len(self.patterns)
+        goto: list[dict[str, int]] = [{}]
+        # Lowest index of a pattern ending in the state, `none` if there is no such pattern
+        best: list[int] = [none]
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    best.append(none)
+                state = next_state
+            best[state] = min(best[state], index)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            # Patterns ending in the fallback state end here as well
+            best[state] = min(best[state], best[fail[state]])
+            for char, next_state in goto[state].items():
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                queue.append(next_state)
+
+        self._goto = goto
+        self._fail = fail
+        self._best = best
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def first_match(self, text: str) -> str | None:
+        """Returns the first pattern (in the original order) contained in the text."""
+        goto, fail, best = self._goto, self._fail, self._best
+        found = best[0]
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if best[state] < found:
+                found = best[state]
+                if not found:
+                    break
+        return self.patterns[found] if found < len(self.patterns) else None
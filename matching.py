@@ -0,0 +1,89 @@
+from bisect import bisect_left
+from collections import deque
+from typing import Sequence
+
+from read import Transaction
+from utils import date_ordinal
+
+
+def match_transfers(
+    transfers: Sequence[Transaction],
+    max_days: int | None = None,
+    prefer_other_bank: bool = False,
+) -> tuple[list[tuple[Transaction, Transaction]], list[Transaction]]:
+    """
+    Pairs transfers with opposite amounts.
+
+    Going through the transfers in the given order, each unpaired transfer is paired with
+    the earliest later unpaired transfer of the opposite amount. If `max_days` is set, the
+    dates of the paired transfers may differ by at most that many days (transfers with
+    an unrecognized date are not restricted). If `prefer_other_bank` is set, a transfer
+    from a different bank is preferred to the earlier one from the same bank.
+
+    Returns the pairs, each as (later transfer, earlier transfer), and the unpaired
+    transfers in the original order.
+    """
+    n = len(transfers)
+    dates = [date_ordinal(t.date) for t in transfers] if max_days is not None else [None] * n
+    # Indices of the transfers without a date (all of them without `max_days`) in ascending
+    # order, indexed by amount and bank
+    index: dict[float, dict[str, deque[int]]] = {}
+    # (date ordinal, index) of the transfers with a date, sorted to bisect the date window.
+    # The transfers are removed once processed or paired.
+    by_date: dict[float, dict[str, list[tuple[int, int]]]] = {}
+    for i, transfer in enumerate(transfers):
+        if dates[i] is None:
+            index.setdefault(transfer.amount, {}).setdefault(transfer.bank, deque()).append(i)
+        else:
+            bucket = by_date.setdefault(transfer.amount, {}).setdefault(transfer.bank, [])
+            bucket.append((dates[i], i))
+    for banks in by_date.values():
+        for bucket in banks.values():
+            bucket.sort()
+
+    def is_candidate(i: int, j: int) -> bool:
+        # Zero amounts are their own opposites, do not pair a transfer with its copy
+        return bool(transfers[i].amount) or transfers[i] != transfers[j]
+
+    def discard(i: int) -> None:
+        if dates[i] is not None:
+            bucket = by_date[transfers[i].amount][transfers[i].bank]
+            del bucket[bisect_left(bucket, (dates[i], i))]
+
+    def earliest_undated(i: int, bucket: deque[int]) -> int:
+        # Transfers processed so far can not be paired with any later transfer anymore
+        while bucket and (bucket[0] <= i or matched[bucket[0]]):
+            bucket.popleft()
+        return next((j for j in bucket if not matched[j] and is_candidate(i, j)), n)
+
+    def earliest_dated(i: int, bucket: list[tuple[int, int]]) -> int:
+        date = dates[i]
+        if date is not None:
+            first = bisect_left(bucket, (date - max_days,))
+            bucket = bucket[first : bisect_left(bucket, (date + max_days + 1,), first)]
+        return min((j for _, j in bucket if is_candidate(i, j)), default=n)
+
+    matched = [False] * n
+    pairs: list[tuple[Transaction, Transaction]] = []
+    for i, transfer in enumerate(transfers):
+        if matched[i]:
+            continue
+        discard(i)
+        best_j, best_other_bank_j = n, n
+        undated, dated = index.get(-transfer.amount, {}), by_date.get(-transfer.amount, {})
+        found = [(earliest_undated(i, bucket), bank) for bank, bucket in undated.items()]
+        found += [(earliest_dated(i, bucket), bank) for bank, bucket in dated.items()]
+        for j, bank in found:
+            if j < best_j:
+                best_j = j
+            if bank != transfer.bank and j < best_other_bank_j:
+                best_other_bank_j = j
+        if prefer_other_bank and best_other_bank_j < n:
+            best_j = best_other_bank_j
+        if best_j < n:
+            matched[i] = matched[best_j] = True
+            discard(best_j)
+            pairs.append((transfers[best_j], transfer))
+
+    unmatched = [t for t, is_matched in zip(transfers, matched) if not is_matched]
+    return pairs, unmatched
@@ -0,0 +1,142 @@
+"""
+Summaries of arbitrary date ranges answered from per-category prefix sums. Requires numpy.
+
+Usage:
+    python periods.py <data_subfolder> monthly
+    python periods.py <data_subfolder> range <from> <to> [days]
+"""
+
+import os
+import sys
+import datetime
+from typing import Iterable
+
+import numpy as np
+
+from columnar import TransactionStore
+from process import Result, build_result, scale_exact
+from utils import date_ordinal, czk_format
+
+
+class PeriodIndex:
+    """
+    Transactions sorted by category and date with prefix sums of their amounts (in haléře,
+    so that the sums are exact). The totals of any range of days are found by two binary
+    searches per category, independent of the number of transactions in the range.
+    Transactions with an unrecognized date are left out.
+    """
+
+    # Greater than any date ordinal, separates the categories in the sort keys
+    _CATEGORY_STRIDE = 1 << 22
+
+    def __init__(self, store: TransactionStore, exclude: Iterable[str] = ()) -> None:
+        ordinals = store.date_ordinals()
+        kept = (ordinals >= 0) & ~store.mask_of(exclude)
+        self.categories = store.categories
+        self.undated = int(np.count_nonzero(ordinals < 0))
+        self.first = int(ordinals[kept].min()) if kept.any() else 0
+        self.last = int(ordinals[kept].max()) if kept.any() else -1
+
+        codes = store.category_codes[kept].astype(np.int64)
+        keys = codes * self._CATEGORY_STRIDE + ordinals[kept]
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        amounts = store.amounts[kept][order]
+        self.exact = store.exact
+        if not self.exact:
+            amounts = np.rint(amounts * 100).astype(np.int64)
+        self._sums = np.concatenate(([0], np.cumsum(amounts)))
+        self._category_offsets = (
+            np.arange(len(self.categories), dtype=np.int64) * self._CATEGORY_STRIDE
+        )
+
+    def totals(self, start: str | int, end: str | int) -> dict[str, float]:
+        """
+        Returns the totals of categories with transactions from `start` to `end` inclusive,
+        in haléře for an exact store.
+        """
+        low = np.searchsorted(self._keys, self._category_offsets + _ordinal(start), side="left")
+        high = np.searchsorted(self._keys, self._category_offsets + _ordinal(end), side="right")
+        sums = self._sums[high] - self._sums[low]
+        present = np.flatnonzero(high > low)
+        if self.exact:
+            return {self.categories[c]: int(sums[c]) for c in present}
+        return {self.categories[c]: int(sums[c]) / 100 for c in present}
+
+    def result(self, start: str | int, end: str | int, days: int | None = None) -> Result:
+        """Returns the result of the range, scaled from `days` to 30 days (as run.py) if given."""
+        totals = self.totals(start, end)
+        if days is not None:
+            totals = self._scale(totals, days)
+        return build_result(totals)
+
+    def months(self) -> list[tuple[str, int, int]]:
+        """Returns the months covered by the index as (YYYY-MM, first day, last day)."""
+        if self.last < self.first:
+            return []
+        months = []
+        day = datetime.date.fromordinal(self.first).replace(day=1)
+        while day.toordinal() <= self.last:
+            following = (day + datetime.timedelta(days=32)).replace(day=1)
+            label = f"{day.year}-{day.month:02d}"
+            months.append((label, day.toordinal(), following.toordinal() - 1))
+            day = following
+        return months
+
+    def monthly(self) -> dict[str, Result]:
+        return {label: self.result(start, end) for label, start, end in self.months()}
+
+    def rolling(self, end: str | int, window: int = 30) -> dict[str, float]:
+        """Returns the totals of the `window` days ending by `end`, averaged to 30 days."""
+        end = _ordinal(end)
+        return self._scale(self.totals(end - window + 1, end), window)
+
+    def _scale(self, totals: dict[str, float], days: int) -> dict[str, float]:
+        if self.exact:
+            return {category: scale_exact(amount, days) for category, amount in totals.items()}
+        return {category: amount * (30 / days) for category, amount in totals.items()}
+
+
+def _ordinal(date: str | int) -> int:
+    if isinstance(date, int):
+        return date
+    ordinal = date_ordinal(date)
+    if ordinal is None:
+        raise ValueError(f"Unrecognized date: {date}")
+    return ordinal
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 3 or sys.argv[2] not in ("monthly", "range"):
+        print(__doc__)
+        sys.exit(1)
+
+    from read import iter_data, collect_csv_paths
+    from categories import skipped_categories
+    from write import write_summary
+
+    data_subfolder = sys.argv[1]
+    name = os.path.basename(os.path.normpath(data_subfolder))
+    csv_paths = collect_csv_paths(data_subfolder)
+    store = TransactionStore.from_transactions(iter_data(*csv_paths, dedup=True))
+    index = PeriodIndex(store, exclude=skipped_categories())
+    if index.undated:
+        print(f"Varování: {index.undated} transakcí nemá rozpoznané datum.")
+
+    if sys.argv[2] == "monthly":
+        print(f"{'Měsíc':<10} {'Příjmy':>20} {'Výdaje':>20} {'Bilance':>20}")
+        for label, result in index.monthly().items():
+            print(
+                f"{label:<10} {czk_format(result.total_income):>20} "
+                f"{czk_format(result.total_expense):>20} {czk_format(result.balance):>20}"
+            )
+            write_summary(result, f"{name} {label}")
+    else:
+        start, end = sys.argv[3], sys.argv[4]
+        days = int(sys.argv[5]) if len(sys.argv) > 5 else None
+        result = index.result(start, end, days)
+        print(f"Příjmy celkem:     {czk_format(result.total_income):>30}")
+        print(f"Výdaje celkem:     {czk_format(result.total_expense):>30}")
+        print(f"Bilance celkem:    {czk_format(result.balance):>30}")
+        write_summary(result, f"{name} {start}-{end}")
@@ -0,0 +1,311 @@
+"""
+Pipelined reading of the bank exports, overlapping the disk reads with the parsing and the
+categorization. I/O threads read the files in blocks, decode threads split the rows and
+parse their fields, and the categorization runs in the calling thread or in a pool of
+processes. The stages are connected by bounded queues, a stage faster than the next one
+waits for it instead of filling the memory. The transactions of each file keep the order
+of its rows.
+
+The depths of the queues and the time the stages waited for each other are returned with
+the transactions (and recorded by the instrumentation), to tune the number of threads.
+"""
+
+import io
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any
+
+from utils import floatify, halerify
+from formats import BankFormat, detect_format
+from categories import export_mapping, install_mapping
+from read import Transaction, categorize, decode_rows
+import instrument
+
+
+IO_THREADS = 4
+DECODE_THREADS = 2
+# Size of the blocks read from the files
+BLOCK_SIZE = 1 << 16
+# Number of rows categorized together
+BATCH_SIZE = 1000
+# Capacity of the queues between the stages, in blocks and in batches
+QUEUE_DEPTH = 8
+# Interval of checking whether the loading was stopped, in seconds
+_POLL = 0.1
+
+
+class _Stopped(Exception):
+    """The consumer stopped the loading, the stages exit."""
+
+
+class MeteredQueue(queue.Queue):
+    """
+    Bounded queue recording its depth after every put, the time its producer waited for
+    free space and the time its consumer waited for an item.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        super().__init__(maxsize)
+        self.puts = 0
+        self.depth_total = 0
+        self.max_depth = 0
+        self.blocked = 0.0
+        self.starved = 0.0
+
+    def put(self, item: Any, block: bool = True, timeout: float | None = None) -> None:
+        start = time.perf_counter()
+        try:
+            super().put(item, block, timeout)
+        finally:
+            self.blocked += time.perf_counter() - start
+        depth = self.qsize()
+        self.puts += 1
+        self.depth_total += depth
+        self.max_depth = max(self.max_depth, depth)
+
+    def get(self, block: bool = True, timeout: float | None = None) -> Any:
+        start = time.perf_counter()
+        item = super().get(block, timeout)
+        self.starved += time.perf_counter() - start
+        return item
+
+    def offer(self, item: Any, stop: threading.Event) -> bool:
+        """Puts the item, unless the loading is stopped first. Returns whether it was put."""
+        while not stop.is_set():
+            try:
+                self.put(item, timeout=_POLL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def take(self, stop: threading.Event) -> Any:
+        """Gets an item, raises `_Stopped` if the loading is stopped first."""
+        while not stop.is_set():
+            try:
+                return self.get(timeout=_POLL)
+            except queue.Empty:
+                pass
+        raise _Stopped()
+
+    def drain(self) -> None:
+        while True:
+            try:
+                self.get_nowait()
+            except queue.Empty:
+                return
+
+
+def _queue_stats(queues: list[MeteredQueue], capacity: int) -> dict[str, float]:
+    puts = sum(q.puts for q in queues)
+    return {
+        "capacity": capacity,
+        "max_depth": max((q.max_depth for q in queues), default=0),
+        "mean_depth": sum(q.depth_total for q in queues) / puts if puts else 0.0,
+        "producer_blocked_seconds": sum(q.blocked for q in queues),
+        "consumer_starved_seconds": sum(q.starved for q in queues),
+    }
+
+
+class _BlockReader(io.RawIOBase):
+    """Binary stream of the blocks put to the queue, ended by an empty block."""
+
+    def __init__(self, blocks: MeteredQueue, stop: threading.Event) -> None:
+        self.blocks = blocks
+        self.stop = stop
+        self.block = memoryview(b"")
+        self.ended = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        while not self.block and not self.ended:
+            block = self.blocks.take(self.stop)
+            if isinstance(block, Exception):
+                self.ended = True
+                raise block
+            self.ended = not block
+            self.block = memoryview(block)
+        n = min(len(buffer), len(self.block))
+        buffer[:n] = self.block[:n]
+        self.block = self.block[n:]
+        return n
+
+
+class _Failure:
+    __slots__ = ("error",)
+
+    def __init__(self, error: Exception) -> None:
+        self.error = error
+
+
+_END = object()
+
+
+def _read_blocks(file_path: str, blocks: MeteredQueue, stop: threading.Event) -> None:
+    try:
+        with open(file_path, "rb") as file:
+            while block := file.read(BLOCK_SIZE):
+                if not blocks.offer(block, stop):
+                    return
+        blocks.offer(b"", stop)
+    except Exception as e:
+        blocks.offer(e, stop)
+
+
+def _decode(
+    bank_format: BankFormat,
+    exact: bool,
+    blocks: MeteredQueue,
+    batches: MeteredQueue,
+    stop: threading.Event,
+) -> None:
+    reader = _BlockReader(blocks, stop)
+    try:
+        stream = io.TextIOWrapper(
+            io.BufferedReader(reader), encoding=bank_format.encoding, newline=""
+        )
+        batch = []
+        for row in decode_rows(stream, bank_format, halerify if exact else floatify):
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                if not batches.offer(batch, stop):
+                    return
+                batch = []
+        if not batch or batches.offer(batch, stop):
+            batches.offer(_END, stop)
+    except Exception as e:
+        if not batches.offer(_Failure(e), stop):
+            return
+        # Lets the I/O thread of the file finish
+        try:
+            while not reader.ended:
+                block = blocks.take(stop)
+                reader.ended = not block or isinstance(block, Exception)
+        except _Stopped:
+            pass
+
+
+def _categorize_batch(batch: list[tuple]) -> list[str]:
+    return [categorize(keys, fallback) for _, _, _, keys, fallback in batch]
+
+
+def load_pipelined(
+    *csv_paths: str, exact: bool = False, workers: int = 1
+) -> tuple[list[list[Transaction]], dict[str, Any]]:
+    """
+    Reads the files, categorizing in `workers` processes if more than one. Returns the
+    transactions of each file (none for the unreadable files, as `read.load_data`) and the
+    statistics of the stages.
+    """
+    formats = [detect_format(path) for path in csv_paths]
+    files = [(path, f) for path, f in zip(csv_paths, formats) if f is not None]
+    block_queues = [MeteredQueue(QUEUE_DEPTH) for _ in files]
+    batch_queues = [MeteredQueue(QUEUE_DEPTH) for _ in files]
+    results: list[list[Transaction]] = [[] for _ in files]
+    failed: dict[int, Exception] = {}
+    # Batches being categorized by the pool, oldest first
+    pending: deque[tuple[int, list[tuple], Future]] = deque()
+    pending_depth = {"max_depth": 0, "depth_total": 0, "submits": 0, "waited": 0.0}
+
+    def collect(i: int, batch: list[tuple], categories: list[str]) -> None:
+        if i in failed:
+            return
+        bank = files[i][1].bank
+        results[i].extend(
+            Transaction(bank, amount, category, info=info, date=date, keys=keys, fallback=fb)
+            for (amount, info, date, keys, fb), category in zip(batch, categories)
+        )
+
+    def resolve_oldest() -> None:
+        i, batch, future = pending.popleft()
+        start = time.perf_counter()
+        try:
+            categories = future.result()
+        except Exception as e:
+            failed.setdefault(i, e)
+            return
+        finally:
+            pending_depth["waited"] += time.perf_counter() - start
+        collect(i, batch, categories)
+
+    def consume(i: int, batches: MeteredQueue) -> None:
+        while (batch := batches.get()) is not _END:
+            if isinstance(batch, _Failure):
+                failed.setdefault(i, batch.error)
+                return
+            if i in failed:
+                # The rest of a file failing to categorize is skipped
+                continue
+            if pool is None:
+                try:
+                    categories = _categorize_batch(batch)
+                except Exception as e:
+                    failed[i] = e
+                    continue
+                collect(i, batch, categories)
+                continue
+            pending.append((i, batch, pool.submit(_categorize_batch, batch)))
+            pending_depth["submits"] += 1
+            pending_depth["depth_total"] += len(pending)
+            pending_depth["max_depth"] = max(pending_depth["max_depth"], len(pending))
+            if len(pending) > QUEUE_DEPTH:
+                resolve_oldest()
+
+    pool = (
+        ProcessPoolExecutor(
+            max_workers=workers, initializer=install_mapping, initargs=(export_mapping(),)
+        )
+        if workers > 1
+        else None
+    )
+    # Set when the consumer ends, also by an error, not to leave the stages waiting
+    stop = threading.Event()
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(IO_THREADS) as io_threads, ThreadPoolExecutor(
+            DECODE_THREADS
+        ) as decode_threads:
+            try:
+                # The pools start the files in order, so the file consumed is always being read
+                for (path, _), blocks in zip(files, block_queues):
+                    io_threads.submit(_read_blocks, path, blocks, stop)
+                for (_, fmt), blocks, batches in zip(files, block_queues, batch_queues):
+                    decode_threads.submit(_decode, fmt, exact, blocks, batches, stop)
+                for i, batches in enumerate(batch_queues):
+                    consume(i, batches)
+                while pending:
+                    resolve_oldest()
+            finally:
+                stop.set()
+                for stage_queue in block_queues + batch_queues:
+                    stage_queue.drain()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    for i, error in failed.items():
+        print(f"Error reading {files[i][1].label} data: {error}")
+        results[i] = []
+    submits = pending_depth["submits"]
+    stats = {
+        "seconds": time.perf_counter() - start,
+        "io_threads": IO_THREADS,
+        "decode_threads": DECODE_THREADS,
+        "categorize_workers": workers,
+        "blocks": _queue_stats(block_queues, QUEUE_DEPTH),
+        "batches": _queue_stats(batch_queues, QUEUE_DEPTH),
+        "categorize": {
+            "capacity": QUEUE_DEPTH + 1,
+            "max_depth": pending_depth["max_depth"],
+            "mean_depth": pending_depth["depth_total"] / submits if submits else 0.0,
+            "consumer_starved_seconds": pending_depth["waited"],
+        },
+    }
+    instrument.record_pipeline(stats)
+    by_path = dict(zip((path for path, _ in files), results))
+    return [by_path.get(path, []) for path in csv_paths], stats
@@ -1,8 +1,12 @@
 import dataclasses
 from collections import defaultdict
+from typing import TYPE_CHECKING
 
 from read import Transaction
-from categories import MAPPING
+from categories import skipped_categories
+
+if TYPE_CHECKING:
+    from columnar import TransactionStore
 
 
 @dataclasses.dataclass
@@ -11,17 +15,56 @@ class Result:
     total_expenses: dict[str, float]
     zeros: dict[str, float]
 
+    @property
+    def total_income(self) -> float:
+        return sum(self.total_incomes.values()) if self.total_incomes else 0.0
+
+    @property
+    def total_expense(self) -> float:
+        return sum(self.total_expenses.values()) if self.total_expenses else 0.0
+
+    @property
+    def balance(self) -> float:
+        return sum(self.total_incomes.values()) + sum(self.total_expenses.values())
+
 
 def get_filtered_data(data: list[Transaction]) -> list[Transaction]:
-    return [t for t in data if t.category not in MAPPING["skip"]]
+    skip = skipped_categories()
+    return [t for t in data if t.category not in skip]
+
 
+def select_category(
+    data: "list[Transaction] | TransactionStore", category: str
+) -> list[Transaction]:
+    if isinstance(data, list):
+        return [t for t in data if t.category == category]
+    return data.select_category(category)
 
-def process_transactions(data: list[Transaction], days: int) -> Result:
+
+def process_transactions(data: "list[Transaction] | TransactionStore", days: int) -> Result:
+    if not isinstance(data, list):
+        # Columnar store, aggregated by vectorized operations
+        return data.process(days, exclude=skipped_categories())
+    if data and isinstance(data[0].amount, int):
+        # Amounts in haléře, summed exactly and scaled once per category
+        exact_totals: dict[str, int] = defaultdict(int)
+        for transaction in get_filtered_data(data):
+            exact_totals[transaction.category] += transaction.amount
+        return build_result({k: scale_exact(v, days) for k, v in exact_totals.items()})
     totals: dict[str, float] = defaultdict(float)
 
     for transaction in get_filtered_data(data):
         totals[transaction.category] += transaction.amount * (30 / days)
+    return build_result(totals)
+
+
+def scale_exact(amount: int, days: int) -> int:
+    """Scales an amount in haléře from `days` to 30 days, rounding halves up."""
+    return (amount * 60 + days) // (2 * days)
+
 
+def build_result(totals: dict[str, float]) -> Result:
+    """Splits the category totals to incomes, expenses and zeros."""
     total_incomes = {
         k: v for k, v in sorted(totals.items(), key=lambda item: item[1], reverse=True) if v > 0
     }
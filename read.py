@@ -1,15 +1,30 @@
+import io
 import os
+import sys
+import time
 import dataclasses
-from typing import Any, Literal, get_args
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Iterable, Iterator
 
-from utils import read_lines, read_from_start_with, get_column, floatify, czk_format
-from categories import get_category, replace_category
+from utils import floatify, halerify, to_czk, czk_format
+from formats import BankFormat, FORMATS, detect_format
+from dedup import Deduplicator
+from categories import (
+    resolve_category,
+    replace_category,
+    normalize_keys,
+    fingerprint,
+    export_mapping,
+    install_mapping,
+)
+import cache
+import instrument
 
 
-BankName = Literal["csob", "raiffeisenbank", "creditas", "unicreditbank"]
+BANK_NAMES = {bank_format.bank for bank_format in FORMATS}
 
-
-BANK_NAMES = set(get_args(BankName))
+AmountParser = Callable[[str], float | int]
 
 DATA_PARENT = "data"
 
@@ -27,42 +42,178 @@ INVALID_CATEGORIES = {
 
 @dataclasses.dataclass(frozen=True, slots=True)
 class Transaction:
-    bank: BankName
-    amount: float
+    bank: str
+    # Integer amounts are in haléře, see `load_data(..., exact=True)`
+    amount: float | int
     category: str
     info: str = ""
     date: str = ""
+    # Inputs of the categorization, kept to recategorize the transaction when the mapping changes
+    keys: tuple[str, ...] = dataclasses.field(default=(), compare=False, repr=False)
+    fallback: str | None = dataclasses.field(default=None, compare=False, repr=False)
 
     def __str__(self) -> str:
         return (
-            f"({self.bank})\t-\t{self.category}: {self.amount:.2f} ({self.info}, {self.date}) CZK"
+            f"({self.bank})\t-\t{self.category}: {to_czk(self.amount):.2f} "
+            f"({self.info}, {self.date}) CZK"
         )
 
     def to_dict(self) -> dict[str, Any]:
         return {
             "bank": self.bank,
-            "amount": self.amount,
+            "amount": to_czk(self.amount),
             "category": self.category,
             "info": self.info,
             "date": self.date
         }
 
 
-def load_data(*csv_paths: str) -> list[Transaction]:
+def load_data(
+    *csv_paths: str,
+    workers: int = 1,
+    use_cache: bool = False,
+    exact: bool = False,
+    dedup: bool = False,
+    pipelined: bool = False,
+) -> list[Transaction]:
+    """
+    Reads the transactions from the files. With more than one worker, the files are read
+    in a pool of processes sharing the mapping loaded by the calling process. The result
+    is the same in both cases. With `use_cache`, the files read before with the same
+    mapping are loaded from the on-disk cache. With `exact`, the amounts are read as
+    integers in haléře and the aggregations sum them exactly. With `dedup`, the
+    transactions already read from the previous files are dropped (see `Deduplicator`).
+    With `pipelined`, the reading, parsing and categorization of the files overlap (see
+    pipeline.py), the workers categorize and the on-disk cache is not used.
+    """
     data: list[Transaction] = []
-    for file in csv_paths:
-        base = os.path.basename(file).lower()
-        if base.startswith("csob"):
-            data.extend(_read_csob(file))
-        elif base.lower().startswith("raif"):
-            data.extend(_read_raiff(file))
-        elif base.lower().startswith("cred"):
-            data.extend(_read_creditas(file))
-        elif base.lower().startswith("unic"):
-            data.extend(_read_unicredit(file))
+    for transactions in _load_files(csv_paths, workers, use_cache, exact, dedup, pipelined):
+        data.extend(transactions)
     return data
 
 
+def stream_data(
+    *csv_paths: str,
+    workers: int = 1,
+    use_cache: bool = False,
+    exact: bool = False,
+    dedup: bool = False,
+    pipelined: bool = False,
+) -> Iterator[Transaction]:
+    """
+    Yields the transactions `load_data` returns with the same arguments. Only the
+    transactions of the file being yielded are kept (and of the files the workers read
+    ahead, all of them when pipelined).
+    """
+    for transactions in _load_files(csv_paths, workers, use_cache, exact, dedup, pipelined):
+        yield from transactions
+
+
+def _load_files(
+    csv_paths: tuple[str, ...],
+    workers: int,
+    use_cache: bool,
+    exact: bool,
+    dedup: bool,
+    pipelined: bool,
+) -> Iterator[Iterable[Transaction]]:
+    """Yields the transactions of the files of `load_data`, a file at a time and in order."""
+    read_file = partial(_read_file, use_cache=use_cache, exact=exact)
+    executor = None
+    if pipelined:
+        from pipeline import load_pipelined
+
+        per_file, _ = load_pipelined(*csv_paths, exact=exact, workers=workers)
+        files: Iterable[tuple[str, list[Transaction]]] = zip(csv_paths, per_file)
+    elif workers > 1 and len(csv_paths) > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=min(workers, len(csv_paths)),
+            initializer=install_mapping,
+            initargs=(export_mapping(),),
+        )
+        files = zip(csv_paths, executor.map(read_file, csv_paths))
+    else:
+        files = ((file, read_file(file)) for file in csv_paths)
+    deduplicator = Deduplicator() if dedup else None
+    try:
+        for file, transactions in files:
+            if deduplicator is None:
+                yield transactions
+            else:
+                yield deduplicator.filter(file, transactions)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    if deduplicator is not None:
+        _report_duplicates(deduplicator)
+
+
+def iter_data(*csv_paths: str, exact: bool = False, dedup: bool = False) -> Iterator[Transaction]:
+    """Yields the transactions from the files one at a time, without loading whole files."""
+    deduplicator = Deduplicator() if dedup else None
+    for file in csv_paths:
+        bank_format = detect_format(file)
+        if bank_format is None:
+            continue
+        try:
+            transactions = _read_format(file, bank_format, halerify if exact else floatify)
+            if deduplicator is not None:
+                transactions = deduplicator.filter(file, transactions)
+            yield from transactions
+        except Exception as e:
+            print(f"Error reading {bank_format.label} data: {e}")
+    if deduplicator is not None:
+        _report_duplicates(deduplicator)
+
+
+def _report_duplicates(deduplicator: Deduplicator) -> None:
+    for file_path, dropped in deduplicator.dropped.items():
+        if dropped:
+            print(
+                f"Varování: Vynecháno {dropped} duplicitních transakcí ze souboru {file_path}."
+            )
+    if instrument.ENABLED:
+        instrument.count("dedup.dropped", sum(deduplicator.dropped.values()))
+        instrument.count("dedup.fingerprints", len(deduplicator))
+
+
+def _read_file(file_path: str, use_cache: bool = False, exact: bool = False) -> list[Transaction]:
+    bank_format = detect_format(file_path)
+    if bank_format is None:
+        return []
+    start = time.perf_counter()
+    if use_cache:
+        key = cache.entry_key(file_path, fingerprint(), "exact" if exact else "")
+        cached: list[tuple] | None = cache.load(key)
+        if cached is not None:
+            transactions = [Transaction(*fields) for fields in cached]
+            if instrument.ENABLED:
+                elapsed = time.perf_counter() - start
+                instrument.record_file(
+                    file_path, bank_format.label, len(transactions), elapsed, cached=True
+                )
+            return transactions
+    try:
+        parse_amount = halerify if exact else floatify
+        transactions = list(_read_format(file_path, bank_format, parse_amount))
+    except Exception as e:
+        print(f"Error reading {bank_format.label} data: {e}")
+        return []
+    if instrument.ENABLED:
+        elapsed = time.perf_counter() - start
+        instrument.record_file(file_path, bank_format.label, len(transactions), elapsed)
+    if use_cache:
+        fields = [
+            (t.bank, t.amount, t.category, t.info, t.date, t.keys, t.fallback) for t in transactions
+        ]
+        try:
+            cache.store(key, fields)
+        except OSError:
+            # The cache only speeds up the next load
+            pass
+    return transactions
+
+
 def collect_csv_paths(data_subfolder: str) -> list[str]:
     data_path = os.path.join(DATA_PARENT, data_subfolder) if data_subfolder else DATA_PARENT
     paths = [os.path.join(data_path, path) for path in os.listdir(data_path)]
@@ -76,147 +227,123 @@ def collect_csv_paths(data_subfolder: str) -> list[str]:
         ]
         csv_paths.extend(dir_files)
     for csv_path in csv_paths:
-        bank = os.path.basename(csv_path).split("_")[0].lower()
-        if not any(bank in bn for bn in BANK_NAMES):
+        if detect_format(csv_path) is None:
             raise ValueError(f"\033[31mUnknown bank file format: {csv_path}\033[0m")
     return csv_paths
 
 
-def _extract_category(row: list[str], category_col: int, *other_cols: int) -> str:
-    """Extracts the category from the row based on the category name and keys."""
-    # First try to read the category directly from the specified column
-    assert all(
-        isinstance(col, int) for col in (category_col, *other_cols)
-    ), "Column indices must be integers"
-
-    category = ""
-    if other_cols:
-        row_keys = [row[col] for col in other_cols]
-        category = get_category(*row_keys)
-    if not category or ("Nezařazeno" in category):
-        category = row[category_col].rstrip(';"')
-    category = replace_category(category.strip())
-    return category or "Nezařazené"
-
-
-def _read_csob(file_path: str) -> list[Transaction]:
-    """Reads a CSV file and returns its content as a list of dictionaries."""
-    try:
-        with open(file_path, mode="r", newline="", encoding="utf-8") as csv_file:
-            reader = read_lines(csv_file.readlines(), first=3)
-            amount_col = get_column(reader[0], "Částka")
-            category_col = get_column(reader[0], "Kategorie")
-            counterparty_number_col = get_column(reader[0], "číslo protiúčtu")
-            counterparty_col = get_column(reader[0], "jméno protistrany")
-            date_col = get_column(reader[0], "datum zaúčtování")
-            msg_col = get_column(reader[0], "zpráva")
-            return [
-                Transaction(
-                    "csob",
-                    floatify(row[amount_col]),
-                    _extract_category(
-                        row,
-                        category_col,
-                        get_column(reader[0], "jméno protistrany"),
-                        get_column(reader[0], "vlastní poznámka"),
-                        msg_col,
-                        get_column(reader[0], "číslo protiúčtu"),
-                    ),
-                    info=row[counterparty_col] or row[counterparty_number_col] or row[msg_col],
-                    date=row[date_col],
-                )
-                for row in reader[1:]
-            ]
-    except Exception as e:
-        print(f"Error reading CSOB Bank data: {e}")
-        return []
+def categorize(keys: tuple[str, ...], fallback: str | None = None) -> str:
+    """
+    Gets the category of a transaction from its keys. If the keys are not in the mapping
+    and the bank provides its own category (`fallback`), the bank's category is used.
+    """
+    if keys or fallback is None:
+        category, outcome = resolve_category(*keys)
+    else:
+        category, outcome = "", "unresolved"
+    if fallback is not None:
+        if not category or ("Nezařazeno" in category):
+            category = fallback.rstrip(';"')
+            outcome = "fallback" if category.strip() else "unresolved"
+        # Interned, not to keep a copy of the bank's category for every transaction
+        category = sys.intern(replace_category(category.strip()) or "Nezařazené")
+    if instrument.ENABLED:
+        instrument.count(f"categorize.{outcome}")
+    return category
 
 
-def _read_raiff(file_path: str) -> list[Transaction]:
-    """Reads a CSV file and returns its content as a list of dictionaries."""
-    try:
-        with open(file_path, mode="r", newline="", encoding="utf-8") as csv_file:
-            reader = read_lines(csv_file.readlines())
-            amount_col = get_column(reader[0], "Zaúčtovaná částka")
-            note_col = get_column(reader[0], "Poznámka")
-            counterparty_col = get_column(reader[0], "Název protiúčtu")
-            counterparty_account_col = get_column(reader[0], "Číslo protiúčtu")
-            date_col = get_column(reader[0], "Datum zaúčtování")
-            name_of_trader_col = get_column(reader[0], "Název obchodníka")
-            return [
-                Transaction(
-                    "raiffeisenbank",
-                    floatify(row[amount_col]),
-                    get_category(
-                        row[name_of_trader_col],
-                        row[note_col],
-                        row[counterparty_col],
-                        row[counterparty_account_col],
-                    ),
-                    info=row[counterparty_col] or row[note_col] or row[counterparty_account_col],
-                    date=row[date_col],
-                )
-                for row in reader[1:]
-            ]
-    except Exception as e:
-        print(f"Error reading Reiff Bank data: {e}")
-        return []
+def _read_format(
+    file_path: str, bank_format: BankFormat, parse_amount: AmountParser = floatify
+) -> Iterator[Transaction]:
+    """Reads a CSV file in the format and yields its rows as transactions."""
+    if instrument.ENABLED:
+        yield from _read_format_timed(file_path, bank_format, parse_amount)
+        return
+    bank = bank_format.bank
+    with open(file_path, mode="r", newline="", encoding=bank_format.encoding) as csv_file:
+        rows = decode_rows(csv_file, bank_format, parse_amount)
+        for amount, info, date, keys, fallback in rows:
+            yield Transaction(
+                bank,
+                amount,
+                categorize(keys, fallback),
+                info=info,
+                date=date,
+                keys=keys,
+                fallback=fallback,
+            )
 
 
-def _read_creditas(file_path: str) -> list[Transaction]:
-    """Reads a CSV file and returns its content as a list of dictionaries."""
+def _read_format_timed(
+    file_path: str, bank_format: BankFormat, parse_amount: AmountParser
+) -> Iterator[Transaction]:
+    """
+    `_read_format` recording the time of reading the file, of splitting and parsing its rows
+    and of categorizing them. The file is read whole first, to time the reads alone.
+    """
+    bank = bank_format.bank
+    start = time.perf_counter()
+    with open(file_path, mode="r", newline="", encoding=bank_format.encoding) as csv_file:
+        content = csv_file.read()
+    clock = time.perf_counter()
+    read_seconds, decode_seconds, categorize_seconds = clock - start, 0.0, 0.0
+    rows = decode_rows(io.StringIO(content, newline=""), bank_format, parse_amount)
     try:
-        with open(file_path, mode="r", newline="", encoding="utf-8-sig") as csv_file:
-            reader = read_from_start_with(csv_file.readlines(), starting="Můj účet")
-            amount_col = get_column(reader[0], "Částka")
-            counterparty_col = get_column(reader[0], "Protiúčet")
-            counterparty_name_col = get_column(reader[0], "Název protiúčtu")
-            date_col = get_column(reader[0], "Datum zaúčtování")
-            note_col = get_column(reader[0], "Zpráva pro protistranu")
-            return [
-                Transaction(
-                    "creditas",
-                    floatify(row[amount_col]),
-                    _extract_category(
-                        row,
-                        get_column(reader[0], "Kategorie"),
-                        counterparty_name_col,
-                        counterparty_col,
-                        note_col,
-                    ),
-                    info=row[counterparty_name_col] or row[counterparty_col] or row[note_col],
-                    date=row[date_col],
-                )
-                for row in reader[1:]
-            ]
-    except Exception as e:
-        print(f"Error reading Creditas Bank data: {e}")
-        return []
+        for amount, info, date, keys, fallback in rows:
+            decoded = time.perf_counter()
+            decode_seconds += decoded - clock
+            category = categorize(keys, fallback)
+            categorize_seconds += time.perf_counter() - decoded
+            yield Transaction(
+                bank, amount, category, info=info, date=date, keys=keys, fallback=fallback
+            )
+            # The time the consumer takes between the rows is not counted
+            clock = time.perf_counter()
+        decode_seconds += time.perf_counter() - clock
+    finally:
+        instrument.record_file_parts(
+            file_path,
+            read=read_seconds,
+            decode=decode_seconds,
+            categorize=categorize_seconds,
+        )
 
 
-def _read_unicredit(file_path: str) -> list[Transaction]:
-    """Reads a CSV file and returns its content as a list of dictionaries."""
-    try:
-        with open(file_path, mode="r", newline="", encoding="utf-8") as csv_file:
-            reader = read_lines(csv_file.readlines(), first=4)
-            amount_col = get_column(reader[0], "Částka")
-            target_col = get_column(reader[0], "Příjemce")
-            details_col = get_column(reader[0], "Detaily transakce 1")
-            date_col = get_column(reader[0], "Datum rezervace")
-            assert len(reader[0]) == len(
-                reader[1]
-            ), f"Header and row length mismatch in Unicredit CSV: {len(reader[0])} != {len(reader[1])}"
-            get_unicredit_category = lambda row: get_category(row[target_col], row[details_col])
-            return [
-                Transaction(
-                    "unicreditbank",
-                    floatify(row[amount_col]),
-                    get_unicredit_category(row),
-                    info=(row[target_col] or row[details_col]).strip('", '),
-                    date=row[date_col],
-                )
-                for row in reader[1:]
-            ]
-    except Exception as e:
-        print(f"Error reading Unicredit Bank data: {e}")
-        return []
+def decode_rows(
+    lines: Iterable[str], bank_format: BankFormat, parse_amount: AmountParser = floatify
+) -> Iterator[tuple[float | int, str, str, tuple[str, ...], str | None]]:
+    """
+    Splits the lines of an export in the format and yields the fields of its rows as
+    (amount, info, date, keys, fallback), everything but the category of a transaction.
+    The values repeated in the rows (dates, counterparties) are shared by the rows.
+    """
+    # Equal values of the previous rows, a value is kept only once
+    shared: dict[Any, Any] = {}
+    share = shared.setdefault
+    rows = bank_format.rows(lines)
+    plan = bank_format.plan(next(rows))
+    info_strip = bank_format.info_strip
+    amount_col, date_col, category_col = plan.amount, plan.date, plan.category
+    key_cols, info_cols = plan.keys, plan.info
+    check_width = bank_format.check_width
+    for row in rows:
+        if check_width:
+            assert plan.width == len(row), (
+                f"Header and row length mismatch in {bank_format.label} CSV: "
+                f"{plan.width} != {len(row)}"
+            )
+            check_width = False
+        keys = normalize_keys(*[row[i] for i in key_cols])
+        keys = share(keys, keys)
+        info = ""
+        for i in info_cols:
+            if row[i]:
+                info = row[i]
+                break
+        if info_strip is not None:
+            info = info.strip(info_strip)
+        fallback = None
+        if category_col is not None:
+            fallback = share(row[category_col], row[category_col])
+        info, date = share(info, info), share(row[date_col], row[date_col])
+        yield parse_amount(row[amount_col]), info, date, keys, fallback
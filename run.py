@@ -1,134 +1,134 @@
-import json
 import sys
-from collections import defaultdict
 
-from read import load_data, czk_format, collect_csv_paths, Transaction
-from process import process_transactions
+from read import load_data, stream_data, czk_format, collect_csv_paths, Transaction
+from process import Result, process_transactions, select_category
+from matching import match_transfers
+from write import write_matching, write_outputs
+from categories import cache_stats
+import instrument
 
 
 DATA_SUBFOLDER = "05_09_25"
 DATA_NAME = "05_09_25"
+# Maximum difference in days between the dates of paired transfers (None for no limit)
+TRANSFER_MAX_DAYS: int | None = None
+TRANSFER_PREFER_OTHER_BANK = True
+# Number of processes reading the CSV files
+LOAD_WORKERS = 1
+# Load the files read before with the same mapping from the on-disk cache
+USE_CACHE = True
+# Keep the transactions in the NumPy-backed columnar store (requires numpy)
+COLUMNAR = False
+# Read the amounts as integers in haléře and sum them exactly
+EXACT_AMOUNTS = False
+# Drop the transactions repeated in exports with overlapping date ranges
+DEDUPLICATE = True
+# Format of the details file, one of write.DETAILS_FORMATS
+DETAILS_FORMAT = "json"
+REST_RATIO = 0.1
 
 
-csv_paths = collect_csv_paths(DATA_SUBFOLDER)
-data = load_data(*csv_paths)
-transfers: list[Transaction] = [t for t in data if t.category == "Převod"]
-orig_transfers = transfers.copy()
-n = len(transfers)
-
-i = 0
-matched_transactions: list[tuple[dict, dict]] = []
-while i < len(transfers):
-    match_found = False
-    j = i + 1
-    while j < len(transfers):
-        if transfers[i].amount == -transfers[j].amount and transfers[i] != transfers[j]:
-            match_found = True
-            break
-        else:
-            j += 1
-    if match_found:
-        t_a = transfers.pop(j)
-        t_b = transfers.pop(i)
-        matched_transactions.append((t_a.to_dict(), t_b.to_dict()))
-    else:
-        i += 1
-
-
-if transfers:
-    print(f"Varování: Nalezeno {n - len(transfers)} spárovaných převodů z celkem {n} převodů.")
-    print("Následující převody nebyly spárovány.")
-    for t in transfers:
-        print(f"- {t.bank}: {czk_format(t.amount)} dne {t.date}, info: {t.info}")
-    print()
-    with open("transaction_matching.json", "w") as f:
-        transaction_matching = {
-            "matched": matched_transactions,
-            "unmatched": [t.to_dict() for r in transfers]
-        }
-        f.write(json.dumps(transaction_matching, indent=4, ensure_ascii=False))
-
-
-days = int(sys.argv[1]) if len(sys.argv) > 1 else 30
-result = process_transactions(data, days=days)
-
-
-total_income = sum(result.total_incomes.values()) if result.total_incomes else 0.0
-print(f"Příjmy celkem:     {czk_format(total_income):>30}")
-total_expense = sum(result.total_expenses.values()) if result.total_expenses else 0.0
-print(f"Výdaje celkem:     {czk_format(total_expense):>30}")
-total = sum(result.total_incomes.values()) + sum(result.total_expenses.values())
-print(f"Bilance celkem:    {czk_format(total):>30}\n")
-
-
-REST_RATIO = 0.1
-cum_amount = 0.0
-below_threshold = True
-print("Příjmy:\n-------")
-for category, amount in result.total_incomes.items():
-    if below_threshold:
-        if cum_amount > (1 - REST_RATIO) * total_income:
-            print(f"------------ Zbylých < 10 % příjmů ------------")
-            below_threshold = False
-        else:
-            cum_amount += amount
-
-    print(f"- {category:<30} {czk_format(amount):>15} {amount / total_income * 100:>6.1f}%")
-cum_amount = 0.0
-below_threshold = True
-print("\nVýdaje:\n-------")
-for category, amount in result.total_expenses.items():
-    if below_threshold:
-        if cum_amount < (1 - REST_RATIO) * total_expense:
-            print(f"------------ Zbylých < 10 % výdajů ------------")
-            below_threshold = False
+def run(
+    data_subfolder: str,
+    data_name: str,
+    days: int = 30,
+    verbose: bool = True,
+    matching_path: str = "transaction_matching.json",
+) -> Result:
+    """Processes the data subfolder and writes the details and summary files named by `data_name`."""
+    with instrument.stage("load"):
+        csv_paths = collect_csv_paths(data_subfolder)
+        if COLUMNAR:
+            from columnar import TransactionStore
+
+            # Stored as read, the transactions of all the files are never kept together
+            data = TransactionStore.from_transactions(
+                stream_data(
+                    *csv_paths,
+                    workers=LOAD_WORKERS,
+                    use_cache=USE_CACHE,
+                    exact=EXACT_AMOUNTS,
+                    dedup=DEDUPLICATE,
+                )
+            )
         else:
-            cum_amount += amount
-    print(f"- {category:<30} {czk_format(amount):>15} {amount / total_expense * 100:>6.1f}%")
-print("\nNeutrální kategorie (0 CZK):\n-------")
-for category in result.zeros.keys():
-    print(f"- {category}")
-
-
-with open(f"details {DATA_NAME}.json", "w", encoding="utf-8") as details_file:
-
-    data_dict = defaultdict(list)
-    for transaction in data:
-        data_dict[transaction.category].append(
-            {
-                "banka": transaction.bank,
-                "částka": czk_format(round(transaction.amount, 2)),
-                "info": transaction.info,
-                "datum": transaction.date,
-            }
+            data = load_data(
+                *csv_paths,
+                workers=LOAD_WORKERS,
+                use_cache=USE_CACHE,
+                exact=EXACT_AMOUNTS,
+                dedup=DEDUPLICATE,
+            )
+    with instrument.stage("match"):
+        transfers: list[Transaction] = select_category(data, "Převod")
+        n = len(transfers)
+        matched, transfers = match_transfers(
+            transfers, max_days=TRANSFER_MAX_DAYS, prefer_other_bank=TRANSFER_PREFER_OTHER_BANK
         )
 
-    json.dump(data_dict, details_file, ensure_ascii=False, indent=2)
-
-
-with open(f"summary {DATA_NAME}.csv", "w", encoding="utf-8") as summary_csv:
-    summary_csv.write("Kategorie;Typ;Částka (CZK)\n")
+    if transfers:
+        if verbose:
+            print(f"Varování: Nalezeno {n - len(transfers)} spárovaných převodů z celkem {n} převodů.")
+            print("Následující převody nebyly spárovány.")
+            for t in transfers:
+                print(f"- {t.bank}: {czk_format(t.amount)} dne {t.date}, info: {t.info}")
+            print()
+        with instrument.stage("write"):
+            write_matching(matched, transfers, matching_path)
+
+    with instrument.stage("aggregate"):
+        result = process_transactions(data, days=days)
+
+    if verbose:
+        print_result(result)
+
+    with instrument.stage("write"):
+        write_outputs(data, result, data_name, DETAILS_FORMAT)
+    if instrument.ENABLED:
+        instrument.write_report(data_name, {"category_cache": cache_stats()})
+    return result
+
+
+def print_result(result: Result) -> None:
+    total_income = result.total_income
+    print(f"Příjmy celkem:     {czk_format(total_income):>30}")
+    total_expense = result.total_expense
+    print(f"Výdaje celkem:     {czk_format(total_expense):>30}")
+    print(f"Bilance celkem:    {czk_format(result.balance):>30}\n")
+
+    cum_amount = 0.0
+    below_threshold = True
+    print("Příjmy:\n-------")
     for category, amount in result.total_incomes.items():
-        summary_csv.write(f"{category};Příjem;{round(amount,2)}\n")
+        if below_threshold:
+            if cum_amount > (1 - REST_RATIO) * total_income:
+                print(f"------------ Zbylých < 10 % příjmů ------------")
+                below_threshold = False
+            else:
+                cum_amount += amount
+
+        print(f"- {category:<30} {czk_format(amount):>15} {amount / total_income * 100:>6.1f}%")
+    cum_amount = 0.0
+    below_threshold = True
+    print("\nVýdaje:\n-------")
     for category, amount in result.total_expenses.items():
-        summary_csv.write(f"{category};Výdaj;{round(amount,2)}\n")
+        if below_threshold:
+            if cum_amount < (1 - REST_RATIO) * total_expense:
+                print(f"------------ Zbylých < 10 % výdajů ------------")
+                below_threshold = False
+            else:
+                cum_amount += amount
+        print(f"- {category:<30} {czk_format(amount):>15} {amount / total_expense * 100:>6.1f}%")
+    print("\nNeutrální kategorie (0 CZK):\n-------")
     for category in result.zeros.keys():
-        summary_csv.write(f"{category};Neutrální;0.0\n")
-
-
-with open(f"summary {DATA_NAME}.json", "w", encoding="utf-8") as summary_file:
-    json.dump(
-        {
-            "celkem": {
-                "příjmy": round(total_income, 2),
-                "výdaje": round(total_expense, 2),
-                "zůstatek": round(total, 2),
-            },
-            "příjmy": {k: round(v, 2) for k, v in result.total_incomes.items()},
-            "výdaje": {k: round(v, 2) for k, v in result.total_expenses.items()},
-            "neutrální": list(result.zeros.keys()),
-        },
-        summary_file,
-        ensure_ascii=False,
-        indent=4,
-    )
+        print(f"- {category}")
+
+
+if __name__ == "__main__":
+
+    # Record the timings and counters to "profile <DATA_NAME>.json" (also by FINANCE_PROFILE=1)
+    if "--profile" in sys.argv:
+        sys.argv.remove("--profile")
+        instrument.enable()
+
+    run(DATA_SUBFOLDER, DATA_NAME, days=int(sys.argv[1]) if len(sys.argv) > 1 else 30)
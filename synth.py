@@ -0,0 +1,186 @@
+"""
+Seeded generator of synthetic bank exports and mapping files, used by the benchmarks.
+"""
+
+import os
+import json
+import random
+import string
+
+
+CATEGORIES = ["Jídlo", "Bydlení", "Auto", "Zábava", "Oblečení", "Zdraví", "Mzda"]
+TRANSFER_COUNTERPARTY = "PREVOD MEZI UCTY"
+BANK_PREFIXES = ("csob", "raiffeisenbank", "creditas", "unicreditbank")
+
+
+def _amount_format(amount: float) -> str:
+    return f"{amount:,.2f}".replace(",", " ").replace(".", ",")
+
+
+class ExportGenerator:
+    """
+    Generates exports sharing a pool of counterparties, some of them known to the mapping.
+    A part of the rows are transfers between own accounts, which pair across the exports.
+    """
+
+    def __init__(
+        self, seed: int = 0, counterparties: int = 500, transfer_ratio: float = 0.05
+    ) -> None:
+        self.rng = random.Random(seed)
+        self.counterparties = [
+            f"{self._word().upper()} {self._word().upper()}" for _ in range(counterparties)
+        ]
+        self.transfer_ratio = transfer_ratio
+        self.transfer_amounts = [round(self.rng.uniform(100, 20000), 0) for _ in range(50)]
+
+    def _word(self, min_len: int = 3, max_len: int = 9) -> str:
+        length = self.rng.randint(min_len, max_len)
+        return "".join(self.rng.choices(string.ascii_lowercase, k=length))
+
+    def _row(self) -> tuple[str, float, tuple[int, int, int]]:
+        """Returns the counterparty, amount and date (year, month, day) of a new transaction."""
+        date = self.rng.randint(2023, 2025), self.rng.randint(1, 12), self.rng.randint(1, 28)
+        if self.rng.random() < self.transfer_ratio:
+            amount = self.rng.choice(self.transfer_amounts)
+            return TRANSFER_COUNTERPARTY, self.rng.choice([amount, -amount]), date
+        amount = round(self.rng.lognormvariate(6, 1.5), 2)
+        amount = amount if self.rng.random() < 0.1 else -amount
+        return self.rng.choice(self.counterparties), amount, date
+
+    def _account(self) -> str:
+        bank_code = self.rng.choice(["0100", "0300", "0600", "5500"])
+        return f"{self.rng.randint(10**5, 10**10)}/{bank_code}"
+
+    def _optional_word(self, probability: float = 0.3) -> str:
+        return self._word() if self.rng.random() < probability else ""
+
+    def write_mapping(
+        self, directory: str, partial_rules: int = 100, exact_rules: int = 100
+    ) -> None:
+        """Writes a mapping with rules for half of the counterparties, padded by random rules."""
+        os.makedirs(directory, exist_ok=True)
+        known = self.counterparties[: len(self.counterparties) // 2]
+        exact = {name: self.rng.choice(CATEGORIES) for name in known[:exact_rules]}
+        exact[TRANSFER_COUNTERPARTY] = "Převod"
+        partial = {
+            name.split()[0].lower(): self.rng.choice(CATEGORIES) for name in known[exact_rules:]
+        }
+        while len(partial) < partial_rules:
+            partial[self._word(5, 12)] = self.rng.choice(CATEGORIES)
+        while len(exact) < exact_rules:
+            exact[self._word(5, 12).upper()] = self.rng.choice(CATEGORIES)
+        mapping = {
+            "exact": exact,
+            "partial": dict(list(partial.items())[:partial_rules]),
+            "category_replace": {"Potraviny": "Jídlo"},
+            "skip": ["Ignorovat"],
+        }
+        with open(os.path.join(directory, "synthetic.json"), "w", encoding="utf-8") as file:
+            json.dump(mapping, file, ensure_ascii=False, indent=4)
+
+    def write_exports(self, directory: str, rows: int, files_per_bank: int = 1) -> list[str]:
+        """Writes exports of all the banks, `rows` rows per file. Returns their paths."""
+        os.makedirs(directory, exist_ok=True)
+        writers = (self.write_csob, self.write_raiff, self.write_creditas, self.write_unicredit)
+        paths = []
+        for k in range(files_per_bank):
+            for prefix, writer in zip(BANK_PREFIXES, writers):
+                paths.append(os.path.join(directory, f"{prefix}_{k}.csv"))
+                writer(paths[-1], rows)
+        return paths
+
+    def write_csob(self, path: str, rows: int) -> None:
+        """ČSOB export: two lines of preamble before the header."""
+        lines = [
+            "Pohyby na účtu;",
+            "Číslo účtu: 123456789/0300;",
+            "číslo účtu;datum zaúčtování;částka;měna;zůstatek;číslo protiúčtu;"
+            "kód banky protiúčtu;jméno protistrany;vlastní poznámka;zpráva;Kategorie",
+        ]
+        for _ in range(rows):
+            counterparty, amount, (year, month, day) = self._row()
+            account = self._account() if self.rng.random() < 0.3 else ""
+            fields = [
+                "123456789",
+                f"{day:02d}.{month:02d}.{year}",
+                _amount_format(amount),
+                "CZK",
+                "0",
+                account,
+                "",
+                counterparty,
+                "",
+                self._optional_word(),
+                self.rng.choice(["Potraviny", "Nezařazeno", ""]),
+            ]
+            lines.append(";".join(fields))
+        self._write(path, lines)
+
+    def write_raiff(self, path: str, rows: int) -> None:
+        """Raiffeisenbank export: quoted fields, the header on the first line."""
+        lines = [
+            '"Datum zaúčtování";"Zaúčtovaná částka";"Měna účtu";"Poznámka";"Název protiúčtu";'
+            '"Číslo protiúčtu";"Název obchodníka"'
+        ]
+        for _ in range(rows):
+            counterparty, amount, (year, month, day) = self._row()
+            is_card_payment = counterparty != TRANSFER_COUNTERPARTY and self.rng.random() < 0.5
+            fields = [
+                f"{day:02d}.{month:02d}.{year}",
+                _amount_format(amount),
+                "CZK",
+                self._optional_word(),
+                "" if is_card_payment else counterparty,
+                "" if is_card_payment else self._account(),
+                counterparty if is_card_payment else "",
+            ]
+            lines.append('"' + '";"'.join(fields) + '"')
+        self._write(path, lines)
+
+    def write_creditas(self, path: str, rows: int) -> None:
+        """Creditas export: BOM and a preamble of varying length before the header."""
+        lines = ["Výpis z účtu", f"Vygenerováno: {self.rng.randint(1, 28)}.1.2025"]
+        lines.extend(f"Poznámka;{self._word()}" for _ in range(self.rng.randint(0, 3)))
+        lines.append(
+            "Můj účet;Datum zaúčtování;Částka;Měna;Protiúčet;Název protiúčtu;"
+            "Zpráva pro protistranu;Kategorie"
+        )
+        for _ in range(rows):
+            counterparty, amount, (year, month, day) = self._row()
+            fields = [
+                "987654321/2250",
+                f"{day:02d}.{month:02d}.{year}",
+                _amount_format(amount),
+                "CZK",
+                self._account(),
+                counterparty,
+                self._optional_word(),
+                self.rng.choice(["Nákupy", "Nezařazené", ""]),
+            ]
+            lines.append(";".join(fields))
+        self._write(path, lines, encoding="utf-8-sig")
+
+    def write_unicredit(self, path: str, rows: int) -> None:
+        """UniCredit export: three lines of preamble, details may span several lines."""
+        lines = ["Účet;1122334455/2700", "Od;01.01.2023", "Do;31.12.2025"]
+        lines.append("Účet;Částka;Měna;Datum rezervace;Příjemce;Detaily transakce 1")
+        for _ in range(rows):
+            counterparty, amount, (year, month, day) = self._row()
+            details = f"Platba {self._word()}"
+            if self.rng.random() < 0.2:
+                details = f'"{details}\n{self._word()} {self._word()}"'
+            fields = [
+                "1122334455",
+                _amount_format(amount),
+                "CZK",
+                f"{year}-{month:02d}-{day:02d}",
+                counterparty,
+                details,
+            ]
+            lines.append(";".join(fields))
+        self._write(path, lines)
+
+    @staticmethod
+    def _write(path: str, lines: list[str], encoding: str = "utf-8") -> None:
+        with open(path, "w", encoding=encoding) as file:
+            file.write("\n".join(lines) + "\n")
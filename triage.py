@@ -0,0 +1,200 @@
+"""
+Report of the transactions the mapping has no rule for, to find the rules worth adding.
+The keys of the transactions are grouped into clusters of near-identical counterparties
+(differing in numbers, branch names and the like), the clusters are ranked by their total
+amount and number of transactions, and a file with a candidate rule for every cluster is
+written in the format of the mapping files, next to the outputs (not to the mapping folder).
+The categories of the rules are PLACEHOLDER, to be replaced before the rules are moved to the
+mapping. An empty category would not do: a partial rule without a category still matches
+first and hides the later partial rules matching the same keys.
+
+Usage: python triage.py <data_subfolder> [top]
+"""
+
+import os
+import re
+import sys
+import json
+import dataclasses
+from collections import Counter, defaultdict
+
+from categories import resolve_category
+from read import Transaction, load_data, collect_csv_paths
+from utils import czk_format
+
+
+# Minimal Jaccard similarity of the tokens of two keys in the same cluster
+SIMILARITY = 0.5
+# Tokens of more keys than this are not used to find similar keys (legal forms, cities)
+MAX_POSTINGS = 50
+# Minimal length of a partial pattern
+MIN_PATTERN = 4
+# Category of the proposed rules, to be replaced by the user
+PLACEHOLDER = "TODO-kategorie"
+
+_TOKEN = re.compile(r"[^\W\d_]{3,}")
+
+
+@dataclasses.dataclass
+class Cluster:
+    """Unresolved keys of near-identical counterparties."""
+
+    keys: Counter[str]
+    # Sum of the amounts, the incomes and the expenses as they are
+    total: float | int
+    # Sum of the absolute values of the amounts, the clusters are ranked by it
+    volume: float | int
+    # Candidate rule, ("partial", pattern) or ("exact", None) for the keys themselves
+    rule: tuple[str, str | None]
+
+    @property
+    def count(self) -> int:
+        return sum(self.keys.values())
+
+
+def unresolved(data: list[Transaction]) -> list[Transaction]:
+    """Returns the transactions whose keys are not in the mapping."""
+    return [t for t in data if t.keys and resolve_category(*t.keys)[1] == "unresolved"]
+
+
+def tokenize(key: str) -> frozenset[str]:
+    """Returns the words of the key, without numbers and short words."""
+    return frozenset(_TOKEN.findall(key.lower()))
+
+
+class _DisjointSets:
+    def __init__(self, n: int) -> None:
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int) -> None:
+        i, j = self.find(i), self.find(j)
+        if i != j:
+            self.parent[max(i, j)] = min(i, j)
+
+
+def cluster_keys(keys: list[str]) -> list[list[int]]:
+    """
+    Groups the keys into clusters of keys with similar tokens. The candidate pairs are
+    found in an inverted index of the tokens, so the keys are not compared each with each.
+    Returns the indices of the keys of every cluster.
+    """
+    tokens = [tokenize(key) for key in keys]
+    sets = _DisjointSets(len(keys))
+    postings: dict[str, list[int]] = defaultdict(list)
+    by_signature: dict[frozenset[str] | str, int] = {}
+    for i, key_tokens in enumerate(tokens):
+        # Keys with the same words are the same counterparty, keys without words are kept apart
+        signature = key_tokens or keys[i]
+        if signature in by_signature:
+            sets.union(by_signature[signature], i)
+            continue
+        by_signature[signature] = i
+        for token in key_tokens:
+            postings[token].append(i)
+
+    for i in by_signature.values():
+        seen = set()
+        for token in tokens[i]:
+            if len(postings[token]) > MAX_POSTINGS:
+                continue
+            for j in postings[token]:
+                if j <= i or j in seen:
+                    continue
+                seen.add(j)
+                shared = len(tokens[i] & tokens[j])
+                if shared >= SIMILARITY * len(tokens[i] | tokens[j]):
+                    sets.union(i, j)
+
+    clusters: dict[int, list[int]] = defaultdict(list)
+    for i in range(len(keys)):
+        clusters[sets.find(i)].append(i)
+    return list(clusters.values())
+
+
+def _rule(keys: list[str], document_frequency: Counter[str]) -> tuple[str, str | None]:
+    """
+    Proposes a partial pattern matching all the keys: their common word shared by the
+    fewest other keys. Single keys and clusters without such a word get exact rules.
+    """
+    if len(keys) > 1:
+        common = frozenset.intersection(*(tokenize(key) for key in keys))
+        common = {token for token in common if len(token) >= MIN_PATTERN}
+        if common:
+            return "partial", min(common, key=lambda t: (document_frequency[t], -len(t), t))
+    return "exact", None
+
+
+def triage(data: list[Transaction]) -> list[Cluster]:
+    """Clusters the unresolved transactions by their first key, the largest clusters first."""
+    transactions = unresolved(data)
+    by_key: dict[str, list[Transaction]] = defaultdict(list)
+    for transaction in transactions:
+        by_key[transaction.keys[0]].append(transaction)
+    keys = list(by_key)
+    document_frequency: Counter[str] = Counter()
+    for key in keys:
+        document_frequency.update(tokenize(key))
+
+    clusters = []
+    for members in cluster_keys(keys):
+        member_keys = [keys[i] for i in members]
+        amounts = [t.amount for key in member_keys for t in by_key[key]]
+        clusters.append(
+            Cluster(
+                keys=Counter({key: len(by_key[key]) for key in member_keys}),
+                total=sum(amounts),
+                volume=sum(abs(amount) for amount in amounts),
+                rule=_rule(member_keys, document_frequency),
+            )
+        )
+    clusters.sort(key=lambda c: (-c.volume, -c.count))
+    return clusters
+
+
+def candidate_mapping(clusters: list[Cluster]) -> dict[str, dict[str, str] | list[str]]:
+    """Returns a mapping file with the rules of the clusters and the PLACEHOLDER categories."""
+    exact: dict[str, str] = {}
+    partial: dict[str, str] = {}
+    for cluster in clusters:
+        kind, pattern = cluster.rule
+        if kind == "partial":
+            partial[pattern] = PLACEHOLDER
+        else:
+            exact.update((key, PLACEHOLDER) for key in cluster.keys)
+    return {"exact": exact, "partial": partial, "category_replace": {}, "skip": []}
+
+
+def print_clusters(clusters: list[Cluster], top: int) -> None:
+    count = sum(cluster.count for cluster in clusters)
+    print(f"Nezařazeno {count} transakcí v {len(clusters)} skupinách.")
+    for rank, cluster in enumerate(clusters[:top], 1):
+        kind, pattern = cluster.rule
+        rule = f'partial "{pattern}"' if kind == "partial" else "exact"
+        print(
+            f"{rank:>4}. {czk_format(cluster.volume):>18}  {cluster.count:>5}x  "
+            f"{len(cluster.keys)} klíčů, návrh: {rule}"
+        )
+        for key, n in cluster.keys.most_common(3):
+            print(f"          {n:>5}x  {key}")
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2:
+        print("Usage: python triage.py <data_subfolder> [top]")
+        sys.exit(1)
+
+    data_subfolder = sys.argv[1]
+    name = os.path.basename(os.path.normpath(data_subfolder))
+    clusters = triage(load_data(*collect_csv_paths(data_subfolder), use_cache=True, dedup=True))
+    print_clusters(clusters, int(sys.argv[2]) if len(sys.argv) > 2 else 20)
+    path = f"triage {name}.json"
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(candidate_mapping(clusters), file, ensure_ascii=False, indent=4)
+    print(f"Návrh pravidel uložen do '{path}', kategorie '{PLACEHOLDER}' je třeba nahradit.")
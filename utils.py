@@ -1,44 +1,68 @@
-import re
+import datetime
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import chain, islice
 from math import inf
-from typing import Literal
+from typing import Any, Hashable, Iterable, Iterator, Literal
 
 
-def read_from_start_with(raw_lines: list[str], starting: str, max_tries: float = inf) -> list[list[str]]:
-    unended_line = False
+def iter_from_start_with(
+    raw_lines: Iterable[str], starting: str, max_tries: float = inf, delimiter: str = ";"
+) -> Iterator[list[str]]:
+    """
+    Yields split lines one at a time, starting with the first line beginning with `starting`
+    (or with the line after `max_tries` skipped lines).
+    """
+    raw_lines = iter(raw_lines)
     k = 0
-    lines: list[list[str]] = []
-    while not raw_lines[k].startswith(starting) and max_tries > k:
+    for line in raw_lines:
+        if line.startswith(starting) or k >= max_tries:
+            return _iter_rows(chain((line,), raw_lines), delimiter)
         k += 1
-    line = raw_lines[k]
-    for line in raw_lines[k : ]:
-        parts = _split_line(line)
-        if unended_line:
-            lines[-1][-1] += ", " + parts[0]
-            lines[-1].extend(parts[1:])
-        else:
-            lines.append(parts)
-        unended_line = re.fullmatch(r"\".*", parts[-1]) is not None
-    return lines
+    return iter(())
+
+
+def read_from_start_with(raw_lines: list[str], starting: str, max_tries: float = inf) -> list[list[str]]:
+    return list(iter_from_start_with(raw_lines, starting, max_tries))
+
 
+def iter_lines(
+    raw_lines: Iterable[str], first: int = 1, last: int = -1, delimiter: str = ";"
+) -> Iterator[list[str]]:
+    """Yields split lines one at a time, from the `first` line (numbered from 1) on."""
+    first = max(first, 1)
+    if last >= 0:
+        assert first <= last, "First line number must be less than or equal to last line number."
+        return _iter_rows(islice(raw_lines, first - 1, last + 1), delimiter)
+    return _iter_rows(islice(raw_lines, first - 1, None), delimiter)
 
 
 def read_lines(raw_lines: list[str], first: int = 1, last: int = -1) -> list[list[str]]:
     """Reads lines from a text file and returns them as a list of lists of strings."""
-    lines: list[list[str]] = []
     if last < 0:
         last = len(raw_lines)
-    first = max(first, 1)
-    assert first <= last, "First line number must be less than or equal to last line number."
+    return list(iter_lines(raw_lines, first, last))
+
+
+def _iter_rows(raw_lines: Iterable[str], delimiter: str = ";") -> Iterator[list[str]]:
+    """
+    Splits the lines, joining the quoted fields spanning several lines. A row is yielded
+    only after the next line is known not to continue it.
+    """
+    row: list[str] | None = None
     unended_line = False
-    for line in raw_lines[first - 1 : last + 1]:
-        parts = _split_line(line)
+    for line in raw_lines:
+        parts = _split_line(line, delimiter)
         if unended_line:
-            lines[-1][-1] += ", " + parts[0]
-            lines[-1].extend(parts[1:])
+            row[-1] += ", " + parts[0]
+            row.extend(parts[1:])
         else:
-            lines.append(parts)
-        unended_line = re.fullmatch(r"\".*", parts[-1]) is not None
-    return lines
+            if row is not None:
+                yield row
+            row = parts
+        unended_line = parts[-1].startswith('"')
+    if row is not None:
+        yield row
 
 
 def get_column(header: list[str], column_name: str) -> int:
@@ -59,14 +83,110 @@ def floatify(value: str) -> float:
     return float(value.replace(",", ".").replace(" ", ""))
 
 
-def czk_format(amount: float) -> str:
+def halerify(value: str) -> int:
+    """
+    Converts a string to an exact integer amount in haléře, handling commas and spaces.
+    Raises ValueError for the strings `floatify` rejects and for fractions of a haléř.
+    """
+    whole, _, fraction = value.replace(" ", "").replace(",", ".").partition(".")
+    if len(fraction) == 2 and fraction.isdigit():
+        return int(whole + fraction)
+    # Zeros after the haléře are exact, other digits are not
+    cents = fraction.rstrip("0") if len(fraction) > 2 else fraction
+    if len(cents) > 2 or (cents and not cents.isdigit()) or not (whole.lstrip("+-") or fraction):
+        raise ValueError(f"could not convert string to haléře: {value!r}")
+    return int(whole + cents.ljust(2, "0"))
+
+
+def to_czk(amount: float | int) -> float:
+    """Converts the amount to koruny, integer amounts are in haléře."""
+    return amount / 100 if isinstance(amount, int) else amount
+
+
+DATE_FORMATS = ("%d.%m.%Y", "%Y-%m-%d", "%d.%m.%y", "%d/%m/%Y")
+
+
+@lru_cache(maxsize=4096)
+def date_ordinal(value: str) -> int | None:
+    """
+    Converts a date from the bank export to a proleptic Gregorian ordinal.
+    The time part, if present, is ignored. Returns None for unrecognized dates.
+    """
+    value = value.strip().strip('"').split(" ")[0]
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, date_format).toordinal()
+        except ValueError:
+            continue
+    return None
+
+
+def czk_format(amount: float | int) -> str:
+    """Formats the amount, integer amounts are in haléře."""
+    if isinstance(amount, int):
+        whole, cents = divmod(abs(amount), 100)
+        sign = "-" if amount < 0 else ""
+        return f"{sign}{whole:,}".replace(",", " ") + f",{cents:02d} CZK"
     return f"{amount:,.2f} CZK".replace(",", " ").replace(".", ",")
 
 
-def _split_line(line: str) -> list[str]:
-    """Splits a line into parts based on semicolon delimiter."""
+class LRUCache:
+    """
+    Size-bounded least-recently-used cache counting its hits, misses and evictions.
+    The cache is bound to a version of the data it was filled from and it is cleared
+    whenever it is bound to a different version.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        assert maxsize > 0, "Cache size must be positive."
+        self.maxsize = maxsize
+        self.version: Hashable = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def bind(self, version: Hashable) -> None:
+        if version != self.version:
+            self._items.clear()
+            self.version = version
+
+    def get(self, key: Hashable) -> Any:
+        """Returns the cached value or None, if the key is not cached."""
+        value = self._items.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._items[key] = value
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._items),
+            "maxsize": self.maxsize,
+        }
+
+
+def _split_line(line: str, delimiter: str = ";") -> list[str]:
+    """Splits a line into parts based on the delimiter (semicolon by default)."""
     line = line.strip()
-    parts = [part.strip().strip('"') for part in line.split('";"')]
+    parts = [part.strip().strip('"') for part in line.split(f'"{delimiter}"')]
     if len(parts) == 1:
-        parts = [part.strip() for part in line.split(";")]
+        parts = [part.strip() for part in line.split(delimiter)]
     return parts
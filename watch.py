@@ -0,0 +1,132 @@
+"""
+Keeps the outputs of a data subfolder up to date with the mapping files. After a mapping
+file changes, only the transactions the changed rules may apply to are recategorized.
+
+Usage: python watch.py <data_subfolder> [days]
+"""
+
+import os
+import sys
+import time
+import dataclasses
+from collections import Counter, defaultdict
+from typing import Iterable
+
+from constants import MAPPING_DIR
+from categories import MappingChange, reload_mapping, skipped_categories
+from read import load_data, collect_csv_paths, categorize, Transaction
+from process import Result, build_result, scale_exact
+from matching import match_transfers
+from write import write_matching, write_details, write_summary
+import run
+
+
+POLL_INTERVAL = 1.0
+
+
+class CategorizedData:
+    """Transactions together with the running totals of their categories."""
+
+    def __init__(self, data: Iterable[Transaction], days: int) -> None:
+        self.data = list(data)
+        self.days = days
+        # Amounts in haléře are summed exactly and scaled in `result`
+        self.exact = bool(self.data) and isinstance(self.data[0].amount, int)
+        self.totals: dict[str, float] = defaultdict(int if self.exact else float)
+        self.counts: Counter[str] = Counter()
+        for transaction in self.data:
+            self._add(transaction)
+
+    def _add(self, transaction: Transaction, sign: int = 1) -> None:
+        if self.exact:
+            self.totals[transaction.category] += sign * transaction.amount
+        else:
+            self.totals[transaction.category] += sign * transaction.amount * (30 / self.days)
+        self.counts[transaction.category] += sign
+        if not self.counts[transaction.category]:
+            del self.counts[transaction.category]
+            del self.totals[transaction.category]
+
+    def extend(self, transactions: Iterable[Transaction]) -> None:
+        for transaction in transactions:
+            self.data.append(transaction)
+            self._add(transaction)
+
+    def apply(self, change: MappingChange) -> list[tuple[Transaction, Transaction]]:
+        """Recategorizes the transactions affected by the change. Returns the (old, new) pairs."""
+        changed = []
+        for i, transaction in enumerate(self.data):
+            if not change.affects(transaction.keys, transaction.category):
+                continue
+            category = categorize(transaction.keys, transaction.fallback)
+            if category != transaction.category:
+                updated = dataclasses.replace(transaction, category=category)
+                self._add(transaction, -1)
+                self._add(updated)
+                self.data[i] = updated
+                changed.append((transaction, updated))
+        return changed
+
+    def result(self) -> Result:
+        skip = skipped_categories()
+        totals = {k: v for k, v in self.totals.items() if k not in skip}
+        if self.exact:
+            totals = {k: scale_exact(v, self.days) for k, v in totals.items()}
+        return build_result(totals)
+
+
+def write_transfers(data: list[Transaction]) -> None:
+    """Writes the matching of the transfers, if some of them are unmatched (as run.py)."""
+    matched, unmatched = match_transfers(
+        [t for t in data if t.category == "Převod"],
+        max_days=run.TRANSFER_MAX_DAYS,
+        prefer_other_bank=run.TRANSFER_PREFER_OTHER_BANK,
+    )
+    if unmatched:
+        write_matching(matched, unmatched)
+
+
+def watch(data_subfolder: str, days: int) -> None:
+    name = os.path.basename(os.path.normpath(data_subfolder))
+    csv_paths = collect_csv_paths(data_subfolder)
+    state = CategorizedData(load_data(*csv_paths, use_cache=True, dedup=True), days)
+    reload_mapping()
+    write_transfers(state.data)
+    write_details(state.data, name)
+    write_summary(state.result(), name)
+    print(f"Sleduji změny v '{MAPPING_DIR}' ({len(state.data)} transakcí), ukončení Ctrl+C.")
+
+    while True:
+        time.sleep(POLL_INTERVAL)
+        try:
+            change = reload_mapping()
+        except (OSError, ValueError, KeyError) as e:
+            # Possibly a mapping file still being saved, the previous mapping is kept
+            print(f"Varování: Mapování nelze načíst: {e}")
+            continue
+        if change is None:
+            continue
+        start = time.perf_counter()
+        changed = state.apply(change)
+        if changed:
+            if any("Převod" in (old.category, new.category) for old, new in changed):
+                write_transfers(state.data)
+            write_details(state.data, name)
+        if changed or change.skip:
+            write_summary(state.result(), name)
+        print(
+            f"Změna mapování: přeřazeno {len(changed)} transakcí "
+            f"za {time.perf_counter() - start:.3f} s."
+        )
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2:
+        print("Usage: python watch.py <data_subfolder> [days]")
+        sys.exit(1)
+
+    try:
+        watch(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 30)
+    except KeyboardInterrupt:
+        pass
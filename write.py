@@ -0,0 +1,206 @@
+import json
+from json.encoder import encode_basestring as _quote
+from typing import IO, TYPE_CHECKING, Iterable
+
+from read import Transaction
+from process import Result
+from utils import czk_format, to_czk
+import instrument
+
+if TYPE_CHECKING:
+    from columnar import TransactionStore
+
+
+def write_matching(
+    matched: Iterable[tuple[Transaction, Transaction]],
+    unmatched: Iterable[Transaction],
+    path: str = "transaction_matching.json",
+) -> None:
+    """Writes the pairs and the unpaired transfers as `json.dumps` writes their `to_dict`."""
+    with open(path, "w") as f:
+        matched_json = [_json_list([_to_json(a, 3), _to_json(b, 3)], 2) for a, b in matched]
+        f.write('{\n    "matched": ' + _json_list(matched_json, 1))
+        f.write(',\n    "unmatched": ' + _json_list([_to_json(t, 2) for t in unmatched], 1))
+        f.write("\n}")
+    instrument.record_output(path)
+
+
+# `Transaction.to_dict` indented by `json.dumps(..., indent=4)`, without building the dict
+_MATCHING_ROW = (
+    '{{{0}"bank": {1},{0}"amount": {2},{0}"category": {3},{0}"info": {4},{0}"date": {5}{6}}}'
+)
+
+
+def _to_json(t: Transaction, level: int) -> str:
+    amount = float.__repr__(to_czk(t.amount))
+    return _MATCHING_ROW.format(
+        "\n" + "    " * (level + 1),
+        _quote(t.bank),
+        amount,
+        _quote(t.category),
+        _quote(t.info),
+        _quote(t.date),
+        "\n" + "    " * level,
+    )
+
+
+def _json_list(items: list[str], level: int) -> str:
+    """Joins the JSON items into a list as `json.dumps(..., indent=4)` at the nesting level."""
+    if not items:
+        return "[]"
+    indent = "\n" + "    " * (level + 1)
+    return "[" + indent + ("," + indent).join(items) + "\n" + "    " * level + "]"
+
+
+# Formats of the details: JSON grouped by category (indented or compact) or one JSON object
+# per line in the order of the data
+DETAILS_FORMATS = ("json", "compact", "ndjson")
+_SUFFIXES = {"json": "json", "compact": "min.json", "ndjson": "ndjson"}
+
+
+def write_outputs(
+    data: "Iterable[Transaction] | TransactionStore",
+    result: Result,
+    name: str,
+    details_format: str = "json",
+) -> None:
+    """Writes the details and the summary, the compact format applies to both."""
+    write_details(data, name, details_format)
+    write_summary(result, name, compact=details_format == "compact")
+
+
+def write_details(
+    data: "Iterable[Transaction] | TransactionStore",
+    name: str,
+    details_format: str = "json",
+    presorted: bool = False,
+) -> None:
+    """
+    Writes the transactions incrementally, one row at a time. For the grouped formats,
+    the transactions are ordered by `group_by_category`, unless they are `presorted`.
+    """
+    assert details_format in DETAILS_FORMATS, f"Unknown details format: {details_format}"
+    path = f"details {name}.{_SUFFIXES[details_format]}"
+    with open(path, "w", encoding="utf-8") as details_file:
+        if details_format == "ndjson":
+            _write_ndjson(details_file, data)
+        else:
+            grouped = data if presorted else group_by_category(data)
+            _write_grouped(details_file, grouped, compact=details_format == "compact")
+    instrument.record_output(path)
+
+
+def append_details(transactions: Iterable[Transaction], name: str) -> None:
+    """Appends the transactions to the details written by `write_details` in ndjson."""
+    path = f"details {name}.{_SUFFIXES['ndjson']}"
+    with open(path, "a", encoding="utf-8") as details_file:
+        _write_ndjson(details_file, transactions)
+    instrument.record_output(path)
+
+
+def group_by_category(
+    data: "Iterable[Transaction] | TransactionStore",
+) -> Iterable[Transaction]:
+    """
+    Orders the transactions by category, the categories in the order of their first
+    appearance and the transactions of a category in their original order.
+    """
+    if hasattr(data, "iter_by_category"):
+        return data.iter_by_category()
+    ranks: dict[str, int] = {}
+    return sorted(data, key=lambda t: ranks.setdefault(t.category, len(ranks)))
+
+
+def _write_grouped(file: IO[str], transactions: Iterable[Transaction], compact: bool) -> None:
+    """Writes the transactions ordered by category as `json.dump` writes the dict of them."""
+    if compact:
+        open_group, close_group, separator = ":[", "]", ","
+        row_format = '{{"banka":{},"částka":{},"info":{},"datum":{}}}'
+    else:
+        open_group, close_group, separator = ": [\n", "\n  ]", ",\n"
+        row_format = (
+            '    {{\n      "banka": {},\n      "částka": {},\n      "info": {},\n'
+            '      "datum": {}\n    }}'
+        )
+    category = None
+    file.write("{")
+    for t in transactions:
+        if t.category != category:
+            if category is not None:
+                file.write(close_group + ",")
+            category = t.category
+            file.write(("" if compact else "\n  ") + _quote(category) + open_group)
+        else:
+            file.write(separator)
+        amount = czk_format(round(t.amount, 2))
+        row = row_format.format(_quote(t.bank), _quote(amount), _quote(t.info), _quote(t.date))
+        file.write(row)
+    if category is not None:
+        file.write(close_group + ("" if compact else "\n"))
+    file.write("}")
+
+
+def _write_ndjson(file: IO[str], transactions: Iterable[Transaction]) -> None:
+    row_format = '{{"kategorie":{},"banka":{},"částka":{},"info":{},"datum":{}}}\n'
+    for t in transactions:
+        amount = czk_format(round(t.amount, 2))
+        file.write(
+            row_format.format(
+                _quote(t.category), _quote(t.bank), _quote(amount), _quote(t.info), _quote(t.date)
+            )
+        )
+
+
+def write_summary(result: Result, name: str, compact: bool = False) -> None:
+    """
+    Writes the summary to a CSV and a JSON file (`summary_dict`) in one pass over the
+    categories, the JSON indented or compact.
+    """
+    json_path = f"summary {name}.{'min.json' if compact else 'json'}"
+    indent = None if compact else 4
+    # Summed as `Result.total_income`, integers for amounts in haléře
+    totals = {"příjmy": 0, "výdaje": 0}
+    sections: dict[str, dict | list] = {"příjmy": {}, "výdaje": {}, "neutrální": []}
+    with open(f"summary {name}.csv", "w", encoding="utf-8") as summary_csv:
+        summary_csv.write("Kategorie;Typ;Částka (CZK)\n")
+        for key, kind, amounts in (
+            ("příjmy", "Příjem", result.total_incomes),
+            ("výdaje", "Výdaj", result.total_expenses),
+        ):
+            total = 0
+            for category, amount in amounts.items():
+                total += amount
+                rounded = round(to_czk(amount), 2)
+                summary_csv.write(f"{category};{kind};{rounded}\n")
+                sections[key][category] = rounded
+            totals[key] = total
+        for category in result.zeros.keys():
+            summary_csv.write(f"{category};Neutrální;0.0\n")
+            sections["neutrální"].append(category)
+
+    summary = {
+        "celkem": {
+            "příjmy": round(to_czk(totals["příjmy"]), 2),
+            "výdaje": round(to_czk(totals["výdaje"]), 2),
+            "zůstatek": round(to_czk(totals["příjmy"] + totals["výdaje"]), 2),
+        },
+        **sections,
+    }
+    with open(json_path, "w", encoding="utf-8") as summary_file:
+        separators = (",", ":") if compact else None
+        json.dump(summary, summary_file, ensure_ascii=False, indent=indent, separators=separators)
+    instrument.record_output(f"summary {name}.csv")
+    instrument.record_output(json_path)
+
+
+def summary_dict(result: Result) -> dict:
+    return {
+        "celkem": {
+            "příjmy": round(to_czk(result.total_income), 2),
+            "výdaje": round(to_czk(result.total_expense), 2),
+            "zůstatek": round(to_czk(result.balance), 2),
+        },
+        "příjmy": {k: round(to_czk(v), 2) for k, v in result.total_incomes.items()},
+        "výdaje": {k: round(to_czk(v), 2) for k, v in result.total_expenses.items()},
+        "neutrální": list(result.zeros.keys()),
+    }